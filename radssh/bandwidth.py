@@ -0,0 +1,119 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Bandwidth Module
+Token bucket rate limits for data sent to, and received from, hosts.
+
+Transfers (and command output reads) call consume() on their host's
+throttle for each block, before sending it or after receiving it, and are
+held back just long enough to stay within an aggregate limit for the
+whole cluster and a limit for each host. Each block reserves its share of
+the host bucket first, then of the aggregate bucket, in the order blocks
+arrive, so active hosts share the aggregate rate evenly: hosts that are
+idle, slowed by their own limit, or by the link, reserve less, and what
+they leave unused goes to the others. Being held back stalls the sender
+(or, for reads, leaves the SSH channel window to fill), so nothing piles
+up in memory, and there are no fixed idle gaps as with *chunk delays.
+'''
+
+import time
+import threading
+
+# Burst allowed after an idle spell, in seconds of the rate (at least MIN_BURST bytes)
+BURST = 0.1
+MIN_BURST = 65536
+
+
+def parse_rate(value):
+    '''Rate setting in MB/s (0 or empty for no limit) as bytes/sec'''
+    return int(float(value or 0) * 1e6)
+
+
+class TokenBucket(object):
+    '''
+    Tokens (bytes) accrue at rate, up to burst. Reservations take tokens
+    at once, into debt if need be, and the reserver waits until the debt
+    would be paid off, so callers are served in turn.
+    '''
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        self.stamp = time.time()
+        self.configure(rate)
+        self.tokens = self.burst
+
+    def configure(self, rate):
+        self.rate = rate
+        self.burst = max(MIN_BURST, rate * BURST)
+
+    def reserve(self, nbytes):
+        '''Take nbytes of tokens; returns seconds to wait before using them'''
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= nbytes
+            return max(0, -self.tokens / self.rate)
+
+
+class HostThrottle(object):
+    '''One host's throttle, drawing on its own bucket and the aggregate one'''
+    def __init__(self, bandwidth, host):
+        self.bandwidth = bandwidth
+        self.host = host
+
+    def consume(self, nbytes):
+        '''Wait until nbytes can be transferred within the limits'''
+        for bucket in (self.bandwidth.bucket(self.host), self.bandwidth.total_bucket):
+            if bucket.rate:
+                delay = bucket.reserve(nbytes)
+                if delay:
+                    time.sleep(delay)
+
+
+class Bandwidth(object):
+    '''Aggregate and per-host transfer rate limits (bytes/sec, 0 for no limit)'''
+    def __init__(self, defaults={}):
+        self.total_bucket = TokenBucket(parse_rate(defaults.get('bandwidth.total', 0)))
+        self.host_rate = parse_rate(defaults.get('bandwidth.host', 0))
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @property
+    def total_limit(self):
+        return self.total_bucket.rate
+
+    @total_limit.setter
+    def total_limit(self, rate):
+        self.total_bucket.configure(rate)
+
+    @property
+    def host_limit(self):
+        return self.host_rate
+
+    @host_limit.setter
+    def host_limit(self, rate):
+        with self.lock:
+            self.host_rate = rate
+            for bucket in self.buckets.values():
+                bucket.configure(rate)
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.host_rate)
+            return self.buckets[host]
+
+    def host(self, host):
+        '''Throttle for transfers with host, or None if there are no limits'''
+        if not (self.total_limit or self.host_limit):
+            return None
+        return HostThrottle(self, str(host))
@@ -58,16 +58,34 @@ log_out=out.log
 # Log all error output to given filename in logdir. Set empty to turn off
 # NOTE: This is in addition to host-by-host error logging
 log_err=err.log
+# Write each host's output to its host log file as it arrives (instead of
+# after the command completes), keeping it out of memory. The consolidated
+# out.log/err.log are assembled from the host logs afterwards.
+log_stream=off
+# Compress log files written after each command (off, gzip, or zstd if the
+# zstandard module is installed). Logs remain readable mid-session, as of
+# the last completed command, with zcat/zstdcat or "python -m radssh.logfile"
+# With log_stream on, only out.log and err.log are compressed
+log_compression=off
+# Also keep a structured, indexed record of command results in logdir
+# (session.records, session.blobs, session.index), which can be queried
+# with "python -m radssh.sessionlog <logdir>"
+log_structured=off
 
 # Command line history file, saved across sessions
 historyfile=~/.radssh_history
 
-# Available modes: {stream, ordered, off}
+# Available modes: {stream, ordered, grouped, dashboard, off}
 output_mode=stream
 # When output_mode is ordered, [No Output] is shown as a placeholder for
 # hosts without any output to show, as an explicit annotation. Use
 # ordered_placeholder=off to disable this
 ordered_placeholder=on
+# When output_mode is ordered, a slow host holds up output of all hosts
+# listed after it. Set ordered_window to limit how many completed hosts
+# may be held back; past that, the slow host's output is shown whenever
+# it completes instead. Use 0 for strict ordering.
+ordered_window=0
 
 # Can override character encoding (will use sys.stdout.encoding if not specified)
 # character_encoding=UTF-8
@@ -78,6 +96,40 @@ quota.time=0
 quota.lines=0
 quota.bytes=0
 
+# Limit the rate (MB/s) of file transfers and command output, for the
+# whole cluster and for each host, so a large push or *tar does not
+# saturate the link. Unused share of the total goes to the busier hosts.
+# 0 = Unlimited; can be changed during a session with *bandwidth
+bandwidth.total=0
+bandwidth.host=0
+
+# File distribution (*sftp, *propagate) as a relay tree: the controller
+# sends to up to sftp.fanout hosts at a time, and each host that receives
+# a verified copy relays it to up to sftp.fanout more, using sftp.relay_ssh
+# (run on the relay host, with the controller's ssh-agent forwarded to it).
+# Set to 0 to send every host its copy directly from the controller.
+sftp.fanout=0
+# Uploads keep many SFTP write requests in flight, and use several SFTP
+# channels on high latency links. Both are sized from the measured round
+# trip time unless set here (0 = automatic)
+sftp.depth=0
+sftp.streams=0
+sftp.relay_ssh=ssh -o BatchMode=yes -p %(port)d %(user)s@%(address)s
+# Check the SHA-256 of each host's existing copy first, and skip hosts that
+# already have identical content. With sftp.delta, hosts with an older copy
+# are only sent the changed blocks (needs python on the remote hosts)
+sftp.skip_identical=off
+sftp.delta=off
+# *propagate streams the file from the source host to the other hosts
+# through an in-memory buffer of this many MB, shared by all uploads
+sftp.stream_buffer=64
+# Set to a directory (e.g. ~/.radssh_store) for *get to keep collected
+# files in a content addressed store there, with each host's copy in the
+# session log directory a read only hard link to it, so content that is
+# already stored (unchanged, or the same as another host's) is not fetched
+# again. Nothing is ever removed from the store. Empty fetches every file
+get.store=
+
 # Connection & Authentication Options
 # Username defaults to $SSH_USER (or $USER) if not set here
 # username=root
@@ -87,6 +139,10 @@ authfile=~/.radssh_auth
 # Network Tweaks
 socket.timeout=30
 keepalive=180
+# Negotiate SSH (zlib) compression with hosts that have no Compression
+# setting in ssh_config. Cuts the size of compressible output (logs,
+# package lists) on slow links, at the cost of CPU on both ends
+compression=off
 
 # Extensions to the shell via plugins
 # System plugin collections always loaded from ${EXEC}/plugins
@@ -128,8 +184,19 @@ force_tty.signon=term length 0
 force_tty.signoff=term length 20
 
 # Should RadSSH initially send auth_none request (needed for OpenSSH 4.3 banner)
+# (skipped for servers whose accepted auth types are saved in auth_hints)
 try_auth_none=off
 
+# Decode private keys (prompting once per key for passphrases) before
+# connecting, instead of on first use during the connection phase. Authfile
+# keys are skipped unless their filter matches a host name in the cluster
+preload_keys=on
+
+# Remember which auth method/key succeeded for each host (and its IP/subnet)
+# and try it first on later connects. Only key fingerprints and key file
+# names are saved, never passwords. Set empty to disable.
+auth_hints=~/.radssh_auth_hints
+
 # Additional settings for plugins (that support settings) can be
 # set in this configuration, using the syntax plugin.PLUGIN_NAME.KEYWORD=value
 plugin.star_tty.prompt_delay=5
@@ -20,14 +20,19 @@ and stderr is a boolean indicating if the message content came from
 stderr (highlight) or not.
 '''
 import sys
+import os
 import threading
 import getpass
+import functools
 from collections import deque, defaultdict
 import queue
 
 
 console_mutex = threading.Lock()
 
+# Upper bound on queued messages rendered into a single terminal write
+CONSOLE_BATCH = 1000
+
 
 def user_input(prompt):
     with console_mutex:
@@ -48,15 +53,21 @@ def monochrome(tag, text):
         yield '[%s] %s\n' % (label, line)
 
 
+@functools.lru_cache(maxsize=4096)
+def colorizer_prefix(label, hilight):
+    '''ANSI line prefix for a host label, computed once per (label, stderr) pair'''
+    color = 1 + hash(label) % 7
+    if hilight:
+        return '\033[30;4%dm[%s]\033[0;1;3%dm ' % (color, label, color)
+    return '\033[3%dm[%s] ' % (color, label)
+
+
 def colorizer(tag, text):
     '''Basic ANSI colorized output - host hash value map to 7-color palette, stderr bold'''
     label, hilight = tag
-    color = 1 + hash(label) % 7
+    prefix = colorizer_prefix(label, hilight)
     for line in text.split('\n'):
-        if hilight:
-            yield '\033[30;4%dm[%s]\033[0;1;3%dm %s\033[0m\n' % (color, label, color, line)
-        else:
-            yield '\033[3%dm[%s] %s\033[0m\n' % (color, label, line)
+        yield prefix + line + '\033[0m\n'
 
 
 class RadSSHConsole(object):
@@ -123,24 +134,58 @@ class RadSSHConsole(object):
         for line in self.recent_history.get(str(label), []):
             print('STALLED: ' + line, end='')
 
+    def write(self, output):
+        '''Single write of formatted output, bypassing sys.stdout buffering when possible'''
+        sys.stdout.flush()
+        try:
+            fd = sys.stdout.fileno()
+        except (AttributeError, ValueError, IOError):
+            # Not backed by a real file (captured or replaced stdout)
+            print(output, end='')
+            sys.stdout.flush()
+            return
+        data = output.encode(sys.stdout.encoding or 'utf-8', 'replace')
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
     def console_thread(self):
-        '''Background-able thread to pull from outputQ and format and print to screen'''
+        '''
+        Background-able thread to pull from outputQ and format and print to screen.
+        Everything already queued (up to CONSOLE_BATCH messages) is rendered into
+        one buffer and written at once, rather than a print and flush per line.
+        '''
         while True:
+            batch = [self.q.get()]
+            try:
+                while len(batch) < CONSOLE_BATCH:
+                    batch.append(self.q.get_nowait())
+            except queue.Empty:
+                pass
+            output = []
             try:
-                tag, text = self.q.get()
                 if not self.quietmode:
-                    with console_mutex:
-                        # Tag is tuple of (label, stderr_flag)
-                        for line in self.formatter(tag, text):
-                            print(line, end='')
+                    for tag, text in batch:
+                        try:
+                            # Tag is tuple of (label, stderr_flag)
                             if self.retain_recent:
-                                self.recent_history[str(tag[0])].append(line)
-                        sys.stdout.flush()
+                                history = self.recent_history[str(tag[0])]
+                                for line in self.formatter(tag, text):
+                                    output.append(line)
+                                    history.append(line)
+                            else:
+                                output.extend(self.formatter(tag, text))
+                        except Exception as e:
+                            output.append('Console Thread Exception: %s\n\n' % str(e))
+                            output.append('(%s): %s\n\n' % (tag, text))
+                    if output:
+                        with console_mutex:
+                            self.write(''.join(output))
             except Exception as e:
                 print('Console Thread Exception: %s\n' % str(e))
-                print('(%s): %s\n' % (tag, text))
             finally:
-                self.q.task_done()
+                for item in batch:
+                    self.q.task_done()
 
 
 if __name__ == '__main__':
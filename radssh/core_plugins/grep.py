@@ -16,17 +16,24 @@ def star_grep(cluster, logdir, cmdline, *args):
     '''Scan (not real grep) for string matches in stdout'''
     # Get from cmdline, not args as it might have signifiance space
     pattern = cmdline[6:].encode(cluster.defaults['character_encoding'])
+    # Scan each distinct output only once, no matter how many hosts returned it
+    scanned = {}
+
+    def matches(buffer):
+        if buffer not in scanned:
+            scanned[buffer] = [(line_number, line.rstrip().decode(cluster.defaults['character_encoding'], 'replace'))
+                               for line_number, line in enumerate(buffer.split(b'\n'), 1) if pattern in line]
+        return scanned[buffer]
+
     for host in cluster:
         job = cluster.last_result.get(host)
         if job:
             res = job.result
-            for line_number, line in enumerate(res.stdout.split(b'\n'), 1):
-                if pattern in line:
-                    print('%s [%d]: %s' % (host, line_number, line.rstrip().decode(cluster.defaults['character_encoding'], 'replace')))
+            for line_number, line in matches(res.stdout):
+                print('%s [%d]: %s' % (host, line_number, line))
             # Do a second pass through stderr, so matching lines can be tagged
-            for line_number, line in enumerate(res.stderr.split(b'\n'), 1):
-                if pattern in line:
-                    print('%s [%d/stderr]: %s' % (host, line_number, line.rstrip().decode(cluster.defaults['character_encoding'], 'replace')))
+            for line_number, line in matches(res.stderr):
+                print('%s [%d/stderr]: %s' % (host, line_number, line))
 
 
 def star_match(cluster, logdir, cmdline, *args):
@@ -43,11 +50,16 @@ def star_match(cluster, logdir, cmdline, *args):
         def include_host(pattern, buffer):
             return pattern in buffer
     enable_list = []
+    # Check each distinct (stdout, stderr) pair only once
+    checked = {}
     for host in cluster:
         job = cluster.last_result.get(host)
         if job:
             res = job.result
-            if include_host(pattern, res.stdout + res.stderr):
+            key = (res.stdout, res.stderr)
+            if key not in checked:
+                checked[key] = include_host(pattern, res.stdout + res.stderr)
+            if checked[key]:
                 enable_list.append(str(host))
     cluster.enable(enable_list)
 
@@ -12,15 +12,25 @@
 '''Breakdown of unique lines (or words) from last command output'''
 
 
+def output_counts(cluster):
+    '''Count of hosts per distinct stdout, so each distinct output is only split once'''
+    counts = {}
+    for host in cluster.connections.keys():
+        job = cluster.last_result.get(host)
+        if job:
+            counts[job.result.stdout] = counts.get(job.result.stdout, 0) + 1
+    return counts.items()
+
+
 class Histogram(object):
     def __init__(self):
         self.d = {}
 
-    def add(self, x):
+    def add(self, x, weight=1):
         if not isinstance(x, list):
             x = list(x)
         for y in x:
-            self.d[y] = self.d.get(y, 0) + 1
+            self.d[y] = self.d.get(y, 0) + weight
 
     def __iter__(self):
         values = [(v, k) for k, v in self.d.items()]
@@ -31,11 +41,8 @@ class Histogram(object):
 def lines(cluster, logdir, cmd, *args):
     '''Print line content and count of repeated lines from last command output'''
     h = Histogram()
-    for host in cluster.connections.keys():
-        job = cluster.last_result.get(host)
-        if job:
-            res = job.result
-            h.add(res.stdout.split(b'\n'))
+    for stdout, host_count in output_counts(cluster):
+        h.add(stdout.split(b'\n'), host_count)
     for count, line in h:
         print('%6d - %s' % (count, line.decode(cluster.defaults['character_encoding'], 'replace')))
 
@@ -43,12 +50,9 @@ def lines(cluster, logdir, cmd, *args):
 def words(cluster, logdir, cmd, *args):
     '''Print line content and count of repeated words from last command output'''
     h = Histogram()
-    for host in cluster.connections.keys():
-        job = cluster.last_result.get(host)
-        if job:
-            res = job.result
-            for line in res.stdout.split(b'\n'):
-                h.add(line.split())
+    for stdout, host_count in output_counts(cluster):
+        for line in stdout.split(b'\n'):
+            h.add(line.split(), host_count)
     for count, line in h:
         print('%6d - %s' % (count, line.decode(cluster.defaults['character_encoding'], 'replace')))
 
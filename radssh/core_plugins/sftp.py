@@ -27,11 +27,24 @@ structured in an easy to use fashion.
     on remote nodes, and after transfer, invoke it with the supplied command
     line arguments.
 
+*sync /path/to/local/dir [/remote/dir]
+    Bring a remote directory tree in line with a local one. Each host's
+    tree is inventoried with a single find (or SFTP directory listings),
+    and only new or changed files (by size and modification time) are
+    sent, along with missing directories and permission changes, as
+    batches of pipelined SFTP requests over a few channels per host.
+    Settings sync_channels and sync_inflight set the channels per host, and
+    the files open at once on each.
+
 *propagate host:/path/to/file
     Similar to *sftp, but master copy of the file resides on remote host,
-    not locally. File is retrieved into a temporary file, then the existing
-    cluster.sftp() call is used to put the file. File attributes for file
-    permissions and user/group ownership is attempted to be preserved.
+    not locally. The file is streamed from that host to all the others at
+    once, through a bounded in-memory buffer (cluster.sftp_stream()), so
+    uploads start as soon as the first blocks arrive. With a relay tree or
+    identical/delta checks configured, it is instead retrieved into a
+    temporary file, and the existing cluster.sftp() call is used to put it.
+    File attributes for file permissions and user/group ownership is
+    attempted to be preserved.
 '''
 
 import os
@@ -39,11 +52,14 @@ import stat
 import tempfile
 
 from radssh.plugins import StarCommand
+from radssh.transfer import download
 
 # Add a settings dict so user can override plugin rutime parameters
 settings = {
     'temp_dir': '/tmp',
-    'script_exec': 'bash -c "%s"'
+    'script_exec': 'bash -c "%s"',
+    'sync_channels': '4',
+    'sync_inflight': '16'
 }
 
 
@@ -83,14 +99,22 @@ def propagate_file(cluster, logdir, cmd, *args):
     if not source_host:
         print('Host [%s] does not appear to be part of current cluster' % host)
         return
+    if not any([cluster.defaults.get('sftp.fanout', '0') not in ('', '0'),
+                cluster.defaults.get('sftp.skip_identical', 'off') == 'on',
+                cluster.defaults.get('sftp.delta', 'off') == 'on']):
+        # Stream straight from the source host to the others, no local copy
+        print('Streaming %s from [%s] to remote hosts...' % (path, source_host))
+        cluster.sftp_stream(source_host, path)
+        return
+    # Relay trees and delta/identical checks work from a complete local copy
     # Get a temp filename (and fd, but close that immediately, we just want the name)
     fd, tempname = tempfile.mkstemp()
     os.close(fd)
     print('Fetching master copy of %s from [%s]' % (path, source_host))
     # Here, we don't care if the source node is enabled or not, grab the file content regardless
     t = cluster.connections[source_host]
+    download(t, path, tempname, throttle=cluster.bandwidth.host(source_host))
     s = t.open_sftp_client()
-    s.get(path, tempname)
     attrs = s.stat(path)
     s.close()
     # Now use cluster.sftp directly to push out the file, including the saved attrs
@@ -99,6 +123,23 @@ def propagate_file(cluster, logdir, cmd, *args):
     os.remove(tempname)
 
 
+def sync(cluster, logdir, cmd, *args):
+    '''Sync a local directory tree to a remote directory on cluster nodes'''
+    localdir = args[0]
+    remotedir = args[1] if len(args) > 1 else os.path.abspath(localdir)
+    if not os.path.isdir(localdir):
+        print('%s is not a directory' % localdir)
+        return
+    res = cluster.sync(localdir, remotedir, int(settings['sync_channels']), int(settings['sync_inflight']))
+    for host, job in sorted(res.items(), key=lambda x: str(x[0])):
+        if job.completed:
+            print('%s: %s' % (host, job.result.stdout))
+            for line in job.result.stderr.splitlines():
+                print('%s: Failed %s' % (host, line))
+        else:
+            print('%s: Failed [%r]' % (host, job.result))
+
+
 def custom_completer(completer, buffer, lead_in, text, state):
     words = buffer.split()
     # Shift to local path completion only for the 1st parameter (2nd arg)
@@ -110,5 +151,6 @@ def custom_completer(completer, buffer, lead_in, text, state):
 star_commands = {
     '*sftp': StarCommand(sftp, tab_completion=custom_completer),
     '*run': StarCommand(script_file_runner, tab_completion=custom_completer),
-    '*propagate': propagate_file
+    '*propagate': propagate_file,
+    '*sync': StarCommand(sync, min_args=1, tab_completion=custom_completer)
 }
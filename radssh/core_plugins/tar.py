@@ -15,11 +15,12 @@ Helper to simplify collecting files from remote hosts
 by tar'ing (and optionally compressing) them prior to transfer.
 Instead of using 'cat', as *get does, the remote command is 'tar'
 with options to feed the resulting tar file contents to stdout
-where RadSSH can write local files with the stdout buffer content.
+where RadSSH streams it straight into a local file for each host.
 '''
 import os
 import itertools
-import traceback
+
+import radssh.star_commands as star
 
 tar_options = {
     '*tar': '-cv',
@@ -35,22 +36,12 @@ def tar_command(cluster, logdir, cmd, *args):
     opts = tar_options.get(cmd.split()[0], '-cv')
     remote_command = 'tar %s %s' % (opts, ' '.join(args))
     print('Collecting files into %s' % logdir)
-    # Temporarily disable console output, since tar contents are coming via stdout
-    save_quiet = cluster.console.quiet(True)
     print(remote_command)
     tar_number = next(tar_sequence)
-    res = cluster.run_command(remote_command)
-    for host, job in res.items():
-        result = job.result
-        if job.completed and result.return_code == 0:
-            outfile = os.path.join(logdir, 'tarfile_%d_%s.%s' % (tar_number, str(host), cmd.split()[0][1:]))
-            with open(outfile, 'wb') as f:
-                f.write(bytes(result.stdout))
-                pass
-        else:
-            print(host, repr(job), result)
-            traceback.print_exc()
-    cluster.console.quiet(save_quiet)
+    # Archive is streamed straight to each host's file, not through the console
+    outfile = os.path.join(logdir, 'tarfile_%d_%%(host)s.%s' % (tar_number, cmd.split()[0][1:]))
+    res = cluster.get(None, outfile, command=remote_command)
+    star.transfer_report(res)
 
 
 star_commands = {
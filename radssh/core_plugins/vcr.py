@@ -15,6 +15,8 @@ import os
 import atexit
 import pprint
 
+from radssh.logfile import open_log
+
 
 vcr = None
 shell = None
@@ -121,7 +123,8 @@ def playback(cluster, logdir, cmd, *args):
         except Exception as e:
             print('Failed to load variables from [%s]' % filename + '.vars')
             print('%r' % e)
-    with open(filename) as f:
+    # Script may be a plain or compressed (.gz/.zst) file
+    with open_log(filename) as f:
         shell(cluster, logdir, f, cluster.defaults)
     print('*** Playback of %s complete ***' % filename)
 
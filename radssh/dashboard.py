@@ -0,0 +1,191 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Dashboard Module
+Full screen progress view of a command running across a large cluster,
+used for the "dashboard" output mode. Streamed output and completions
+are tallied as they arrive, but the screen is only redrawn a few times
+per second, no matter how many hosts are reporting in.
+
+Shows completion counters, return code buckets, the slowest in-flight
+hosts, output throughput, and a tail of recent output lines, with
+identical lines from different hosts grouped together. Hosts are timed
+from when their command starts running; hosts still waiting for a free
+dispatcher thread are counted as queued.
+
+Uses curses when available and stdout is a terminal, otherwise falls
+back to a (rate limited) one line summary on the console status line.
+'''
+
+import sys
+import time
+import threading
+import queue
+from collections import OrderedDict, Counter
+
+try:
+    import curses
+except ImportError:
+    curses = None
+
+
+class Dashboard(object):
+    '''Rate limited live status display for a single run_command'''
+    def __init__(self, total, console=None, refresh_rate=4, tail_size=200):
+        self.total = total
+        self.console = console
+        self.interval = 1.0 / refresh_rate
+        self.tail_size = tail_size
+        # Streamed output lands here (in place of the console queue)
+        self.q = queue.Queue(1000)
+        self.lock = threading.Lock()
+        self.queued = set()
+        self.in_flight = {}
+        self.completed = 0
+        self.return_codes = Counter()
+        self.chars_received = 0
+        self.lines_received = 0
+        self.tail = OrderedDict()
+        self.start_time = time.time()
+        self.done = threading.Event()
+        self.screen = None
+        self.background_thread = threading.Thread(target=self.dashboard_thread, args=())
+        self.background_thread.daemon = True
+        self.background_thread.name = 'Dashboard'
+
+    def start(self):
+        self.start_time = time.time()
+        self.background_thread.start()
+
+    def stop(self):
+        '''Final redraw, restore the terminal, and print a summary line'''
+        self.done.set()
+        self.background_thread.join()
+        print(self.summary())
+
+    def submitted(self, host):
+        with self.lock:
+            self.queued.add(host)
+
+    def started(self, host):
+        '''Host's command has started running (called from its dispatcher thread)'''
+        with self.lock:
+            self.queued.discard(host)
+            self.in_flight[host] = time.time()
+
+    def finished(self, host, job):
+        '''Tally a completed job, bucketed by return code (or failure status)'''
+        if job.completed:
+            bucket = 'rc %s' % job.result.return_code if job.result.return_code is not None else job.result.status
+        else:
+            bucket = job.result.__class__.__name__
+        with self.lock:
+            self.queued.discard(host)
+            self.in_flight.pop(host, None)
+            self.completed += 1
+            self.return_codes[bucket] += 1
+
+    def collect(self, item):
+        '''Fold a streamed (tag, text) item into counters and grouped output tail'''
+        (host, stderr), text = item
+        lines = text.split('\n')
+        self.chars_received += len(text)
+        self.lines_received += len(lines)
+        for line in lines[-self.tail_size:]:
+            # Key on the text alone, so identical lines from many hosts collapse
+            hosts = self.tail.pop(line, None)
+            if hosts is None:
+                hosts = set()
+            hosts.add(host)
+            self.tail[line] = hosts
+        while len(self.tail) > self.tail_size:
+            self.tail.popitem(last=False)
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        buckets = ', '.join(['%s: %d' % (k, v) for k, v in sorted(self.return_codes.items(), key=str)])
+        return 'Completed %d/%d hosts in %.1fs (%s)' % (self.completed, self.total, elapsed, buckets or 'no results')
+
+    def render(self):
+        '''List of text lines for the current state, to fit in height rows'''
+        elapsed = time.time() - self.start_time
+        now = time.time()
+        with self.lock:
+            slowest = sorted(self.in_flight.items(), key=lambda x: x[1])
+            queued = len(self.queued)
+            buckets = sorted(self.return_codes.items(), key=lambda x: -x[1])
+            completed = self.completed
+        rate = self.chars_received / elapsed if elapsed > 0 else 0
+        lines = [
+            'RadSSH Dashboard   %d/%d complete   %d in flight   %d queued   %.1fs elapsed' %
+            (completed, self.total, len(slowest), queued, elapsed),
+            'Output: %d lines, %d chars (%.1f K/s)   Hosts/s: %.1f' %
+            (self.lines_received, self.chars_received, rate / 1024, completed / elapsed if elapsed > 0 else 0),
+            '',
+            'Results: ' + ('   '.join(['%s [%d]' % (k, v) for k, v in buckets]) or '-'),
+            '',
+            'Slowest in flight:']
+        for host, started in slowest[:5]:
+            lines.append('  %8.1fs  %s' % (now - started, host))
+        lines.append('')
+        lines.append('Recent output:')
+        for text, hosts in reversed(self.tail.items()):
+            if len(hosts) == 1:
+                lines.append('  [%s] %s' % (next(iter(hosts)), text))
+            else:
+                lines.append('  [%d hosts] %s' % (len(hosts), text))
+            if len(lines) > 200:
+                break
+        return lines
+
+    def draw(self):
+        if not self.screen:
+            if self.console:
+                self.console.status(self.summary())
+            return
+        height, width = self.screen.getmaxyx()
+        self.screen.erase()
+        for row, line in enumerate(self.render()[:height]):
+            try:
+                self.screen.addnstr(row, 0, line, width - 1)
+            except curses.error:
+                pass
+        self.screen.refresh()
+
+    def dashboard_thread(self):
+        '''Drain streamed output continuously, redraw at most refresh_rate times per second'''
+        if curses and sys.stdout.isatty():
+            try:
+                self.screen = curses.initscr()
+                try:
+                    curses.curs_set(0)
+                except curses.error:
+                    pass
+            except curses.error:
+                self.screen = None
+        try:
+            next_draw = 0
+            while not self.done.is_set() or not self.q.empty():
+                try:
+                    item = self.q.get(timeout=self.interval)
+                    self.collect(item)
+                    self.q.task_done()
+                except queue.Empty:
+                    pass
+                if time.time() >= next_draw:
+                    self.draw()
+                    next_draw = time.time() + self.interval
+            self.draw()
+        finally:
+            if self.screen:
+                curses.endwin()
+                self.screen = None
@@ -0,0 +1,193 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+File Store Module
+Content addressed store for files collected from hosts (*get).
+
+Each distinct file content is kept once, under its SHA-256, and the
+per-host copies in the session log directory are hard links to it (or
+plain copies, where the store is on another filesystem). Before anything
+is fetched, one command per host reports the size, modification time,
+and SHA-256 of each requested file; the hash is only computed if the size
+or modification time differ from the last collection of that file from
+that host. Content already in the store is linked rather than fetched, so
+repeat collections, and files identical across hosts, cost no transfer.
+Hosts collecting in parallel take turns on each SHA-256, so content new to
+the store is fetched from one of them, and linked for the others.
+
+Store layout:
+    objects/ab/abcdef...    content, by SHA-256 (read only)
+    index.json              {host: {path: [size, mtime, sha256]}} as of the last collection
+'''
+
+import os
+import json
+import uuid
+import shlex
+import shutil
+import hashlib
+import threading
+
+from .transfer import download, remote_run
+
+MANIFEST_ENTRY = ('x=$(stat -L -c "%%s %%Y" -- %(path)s 2>/dev/null) && '
+                  'echo %(index)d $x $([ "$x" = "%(known)s" ] || sha256sum < %(path)s 2>/dev/null)')
+
+
+class FileStore(object):
+    '''Content addressed store of collected files, with the index of what each host had'''
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        for subdir in ('objects', 'tmp'):
+            if not os.path.isdir(os.path.join(self.path, subdir)):
+                os.makedirs(os.path.join(self.path, subdir))
+        try:
+            with open(os.path.join(self.path, 'index.json')) as f:
+                self.index = json.load(f)
+        except (IOError, ValueError):
+            self.index = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    def has(self, digest):
+        return bool(digest) and os.path.exists(self.object_path(digest))
+
+    def known(self, host, path):
+        '''[size, mtime, sha256] of path on host as of the last collection, or None'''
+        with self.lock:
+            return self.index.get(str(host), {}).get(path)
+
+    def fetch(self, t, path, throttle=None):
+        '''Download path over transport t (within throttle's limits) into the store; returns (sha256, bytes)'''
+        tmpfile = os.path.join(self.path, 'tmp', uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        try:
+            received = download(t, path, tmpfile, digest=digest, throttle=throttle)
+            digest = digest.hexdigest()
+            target = self.object_path(digest)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                # Another host had the same content
+                os.unlink(tmpfile)
+            else:
+                os.chmod(tmpfile, 0o444)
+                os.rename(tmpfile, target)
+        except Exception:
+            if os.path.exists(tmpfile):
+                os.unlink(tmpfile)
+            raise
+        return digest, received
+
+    def obtain(self, t, path, digest, throttle=None):
+        '''
+        Make sure the content of path (expected to have SHA-256 digest) is in
+        the store, fetching it over transport t if need be; returns (sha256,
+        bytes fetched, or None if it was already stored). Callers with the same
+        digest wait their turn, so it is fetched only once. Content of unknown
+        digest (None) is always fetched.
+        '''
+        if not digest:
+            return self.fetch(t, path, throttle)
+        with self.lock:
+            lock = self.locks.setdefault(digest, threading.Lock())
+        with lock:
+            if self.has(digest):
+                return digest, None
+            return self.fetch(t, path, throttle)
+
+    def link(self, digest, dstfile):
+        '''Place the stored content as dstfile, as a hard link if possible'''
+        if not os.path.isdir(os.path.dirname(dstfile)):
+            os.makedirs(os.path.dirname(dstfile), exist_ok=True)
+        if os.path.lexists(dstfile):
+            os.unlink(dstfile)
+        try:
+            os.link(self.object_path(digest), dstfile)
+        except OSError:
+            # Store on another filesystem (or no hard links)
+            shutil.copyfile(self.object_path(digest), dstfile)
+
+    def record(self, host, path, size, mtime, digest):
+        with self.lock:
+            self.index.setdefault(str(host), {})[path] = [size, mtime, digest]
+
+    def save(self):
+        '''Write out the index (call once a collection is done)'''
+        tmpfile = os.path.join(self.path, 'tmp', 'index.json.%s' % uuid.uuid4().hex)
+        with self.lock:
+            with open(tmpfile, 'w') as f:
+                json.dump(self.index, f, separators=(',', ':'))
+        os.rename(tmpfile, os.path.join(self.path, 'index.json'))
+
+
+def remote_manifest(t, paths, known=None):
+    '''
+    {path: (size, mtime, sha256)} for paths on transport t, from a single
+    command. Paths whose size and mtime match known[path] are not hashed
+    (sha256 is None), nor are any if the host lacks sha256sum. Paths that
+    could not be stat'ed (or if the host lacks GNU stat) are left out.
+    '''
+    known = known or {}
+    cmd = '; '.join([MANIFEST_ENTRY % {'index': n, 'path': shlex.quote(path),
+                                       'known': '%d %d' % tuple(known[path][:2]) if known.get(path) else ''}
+                     for n, path in enumerate(paths)])
+    return_code, stdout, stderr = remote_run(t, cmd)
+    manifest = {}
+    for line in stdout.decode('UTF-8', 'replace').splitlines():
+        fields = line.split()
+        if len(fields) < 3 or not fields[0].isdigit() or int(fields[0]) >= len(paths):
+            continue
+        try:
+            size, mtime = int(fields[1]), int(fields[2])
+        except ValueError:
+            continue
+        digest = fields[3] if len(fields) > 3 and len(fields[3]) == 64 else None
+        manifest[paths[int(fields[0])]] = (size, mtime, digest)
+    return manifest
+
+
+def collect(t, host, paths, dstfiles, store, throttle=None):
+    '''
+    Collect paths from host (over transport t, within the rate limits of
+    throttle, if given) into the corresponding dstfiles, through store.
+    Returns (bytes fetched, {path: how}), where how is fetched, unchanged
+    (same as the last collection), or stored (content already in the store,
+    from another host or an earlier version), or the exception if it failed.
+    '''
+    known = dict([(path, store.known(host, path)) for path in paths])
+    manifest = remote_manifest(t, paths, known)
+    fetched = 0
+    outcome = {}
+    for path, dstfile in zip(paths, dstfiles):
+        try:
+            size, mtime, digest = manifest.get(path, (None, None, None))
+            previous = known.get(path)
+            if digest is None and previous and size is not None and [size, mtime] == previous[:2]:
+                # Unchanged since the last collection, so not hashed
+                digest = previous[2]
+            digest, received = store.obtain(t, path, digest, throttle)
+            if received is None:
+                how = 'unchanged' if previous and previous[2] == digest else 'stored'
+            else:
+                fetched += received
+                how = 'fetched'
+            store.link(digest, dstfile)
+            if size is not None:
+                store.record(host, path, size, mtime, digest)
+            outcome[path] = how
+        except Exception as e:
+            outcome[path] = e
+    return fetched, outcome
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Output Grouping Module
+Group hosts whose command output is identical (dshbak style), so that
+each distinct output only needs to be shown once, along with a compact
+host list like "web[001-120,130]".
+
+Results are grouped by the SHA-256 digests of stdout and stderr (computed
+incrementally by StreamBuffer as data arrives) and the return code.
+
+BlobStore uses the same digests to keep only one copy of identical output
+in memory, so that post processing (like *grep or *lines) can be done once
+per distinct output, rather than once per host.
+'''
+
+import re
+import hashlib
+from collections import defaultdict
+
+HOST_NUMBER = re.compile(r'^(.*?)(\d+)(\D*)$')
+
+
+def compress_hostlist(hosts):
+    '''
+    Collapse numbered host names into bracketed ranges:
+        web001, web002, web003, web007, db1 => db1,web[001-003,007]
+    Zero padded numbers are kept apart from shorter unpadded ones, so
+    the ranges always expand back to the original names.
+    '''
+    series = defaultdict(list)
+    others = []
+    for host in set([str(x) for x in hosts]):
+        match = HOST_NUMBER.match(host)
+        if not match:
+            others.append(host)
+            continue
+        prefix, digits, suffix = match.groups()
+        width = len(digits) if digits.startswith('0') and len(digits) > 1 else 0
+        series[(prefix, suffix, width)].append(int(digits))
+    # Unpadded numbers of full width belong with the padded ones (web099, web100)
+    for (prefix, suffix, width) in list(series):
+        unpadded = series.get((prefix, suffix, 0))
+        if width and unpadded:
+            series[(prefix, suffix, width)].extend([n for n in unpadded if len(str(n)) == width])
+            unpadded[:] = [n for n in unpadded if len(str(n)) != width]
+            if not unpadded:
+                del series[(prefix, suffix, 0)]
+    names = list(others)
+    for (prefix, suffix, width), numbers in series.items():
+        if len(numbers) == 1:
+            names.append('%s%0*d%s' % (prefix, width, numbers[0], suffix))
+            continue
+        numbers.sort()
+        ranges = []
+        start = end = numbers[0]
+        for n in numbers[1:] + [None]:
+            if n == end + 1:
+                end = n
+                continue
+            if start == end:
+                ranges.append('%0*d' % (width, start))
+            else:
+                ranges.append('%0*d-%0*d' % (width, start, width, end))
+            if n is not None:
+                start = end = n
+        names.append('%s[%s]%s' % (prefix, ','.join(ranges), suffix))
+    return ','.join(sorted(names))
+
+
+def result_digest(result, stream='stdout'):
+    '''Hex digest for a CommandResult stream, using the incrementally computed one if available'''
+    digest = getattr(result, stream + '_digest', None)
+    if digest:
+        return digest
+    return hashlib.sha256(getattr(result, stream, b'')).hexdigest()
+
+
+class BlobStore(object):
+    '''Content addressed store, so hosts with identical output share a single bytes object'''
+    def __init__(self):
+        self.blobs = {}
+        self.references = 0
+
+    def intern(self, data, digest=None):
+        '''Return the stored copy of data (storing it if new)'''
+        if not data:
+            return data
+        self.references += 1
+        if not digest:
+            digest = hashlib.sha256(data).hexdigest()
+        return self.blobs.setdefault(digest, data)
+
+    def intern_result(self, result):
+        '''Swap CommandResult stdout/stderr for their stored copies'''
+        if getattr(result, 'file_backed', False):
+            # Output lives in log files, not memory
+            return
+        for stream in ('stdout', 'stderr'):
+            data = getattr(result, stream, None)
+            if isinstance(data, bytes):
+                setattr(result, stream, self.intern(data, getattr(result, stream + '_digest', None)))
+
+    def __len__(self):
+        return len(self.blobs)
+
+    def __str__(self):
+        return '<%s: %d references to %d blobs (%d bytes)>' % (
+            self.__class__.__name__, self.references, len(self.blobs), sum([len(x) for x in self.blobs.values()]))
+
+
+class OutputGroups(object):
+    '''Hosts grouped by identical (stdout, stderr, return code) results, in order of first appearance'''
+    def __init__(self):
+        self.groups = {}
+        self.numbers = {}
+        self.order = []
+        # Groups that gained hosts since changes() was last called
+        self.changed = set()
+
+    def add(self, host, job):
+        '''Add a host's JobSummary; returns (group number, True if first host with this output)'''
+        result = job.result
+        if job.completed and hasattr(result, 'stdout'):
+            key = (result_digest(result, 'stdout'), result_digest(result, 'stderr'), result.return_code)
+        else:
+            key = (None, str(result), None)
+        self.changed.add(key)
+        if key in self.groups:
+            self.groups[key].append(host)
+            return self.numbers[key], False
+        self.groups[key] = [host]
+        self.order.append(key)
+        self.numbers[key] = len(self.order)
+        return self.numbers[key], True
+
+    def changes(self):
+        '''(group number, return code, host list) of groups that gained hosts since the last call'''
+        changed = [(self.numbers[key], key[2], self.groups[key]) for key in self.order if key in self.changed]
+        self.changed.clear()
+        return changed
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        '''Yield (group number, return code, host list) in order of first appearance'''
+        for n, key in enumerate(self.order, 1):
+            yield n, key[2], self.groups[key]
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: python -m radssh.grouping host [host ...]')
+        sys.exit(0)
+    print(compress_hostlist(sys.argv[1:]))
@@ -0,0 +1,214 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Log File Module
+Optionally compressed session log files (gzip, or zstd if the zstandard
+module is installed).
+
+Compressed logs are written as a series of independent gzip members (or
+zstd frames), with a new one started after every flush(). The file is
+therefore valid, and readable with standard tools (zcat, zstdcat), as of
+the last flush, even while the session is still running; appending to an
+existing log just adds more members.
+
+read_log() and open_log() read plain or compressed logs transparently,
+ignoring an incomplete member still being written at the end of the file.
+open_log() (and the command line) decompress as they read, a member at a
+time, so logs far larger than memory can be read.
+
+Usage: python -m radssh.logfile <logfile> [...]
+'''
+
+import os
+import io
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Compressed data read from the file at a time
+CHUNKSIZE = 65536
+
+
+def log_compression(setting):
+    '''Validated compression setting (off, gzip, zstd), falling back to gzip if zstd is unavailable'''
+    setting = (setting or 'off').strip().lower()
+    if setting in ('', 'off', 'none'):
+        return 'off'
+    if setting == 'zstd' and not zstandard:
+        logging.getLogger('radssh').warning('zstandard module not installed; compressing logs with gzip')
+        return 'gzip'
+    if setting not in SUFFIX:
+        raise ValueError('Unsupported log compression "%s" (use off, gzip, or zstd)' % setting)
+    return setting
+
+
+class CompressedLog(object):
+    '''Append-only log file writer, compressing as a sequence of self-contained members/frames'''
+    def __init__(self, filename, compression='gzip', level=None, buffering=-1):
+        self.f = open(filename, 'ab', buffering)
+        self.compression = compression
+        if compression == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=level or 3)
+        else:
+            self.level = level or 1
+        self.member = None
+
+    def start(self):
+        if self.compression == 'zstd':
+            return self.compressor.compressobj()
+        # wbits 31 gives gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def write(self, data):
+        if not data:
+            return
+        if not self.member:
+            self.member = self.start()
+        self.f.write(self.member.compress(data))
+
+    def flush(self):
+        '''Finish the current member, so everything written so far is readable'''
+        if self.member:
+            self.f.write(self.member.flush())
+            self.member = None
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def new_decompressor(magic):
+    if magic == ZSTD_MAGIC:
+        return zstandard.ZstdDecompressor().decompressobj()
+    # wbits 31 expects gzip header and trailer
+    return zlib.decompressobj(31)
+
+
+def iter_members(f, magic, chunksize=CHUNKSIZE):
+    '''
+    Decompressed content of each gzip member or zstd frame read from file
+    object f, in turn, stopping at an incomplete one. The file is read a
+    chunk at a time, so only one member's content is held in memory at once.
+    '''
+    errors = (zlib.error, getattr(zstandard, 'ZstdError', zlib.error))
+    data = f.read(chunksize)
+    while True:
+        if len(data) < len(magic):
+            data += f.read(chunksize)
+        if not data.startswith(magic):
+            return
+        d = new_decompressor(magic)
+        output = []
+        while True:
+            try:
+                output.append(d.decompress(data))
+            except errors:
+                return
+            if d.eof:
+                break
+            data = f.read(chunksize)
+            if not data:
+                # Member still being written
+                return
+        yield b''.join(output)
+        data = d.unused_data
+
+
+def resolve(filename):
+    '''Log filename, with the .gz/.zst suffix added if it was omitted'''
+    if not os.path.exists(filename):
+        for suffix in SUFFIX.values():
+            if os.path.exists(filename + suffix):
+                return filename + suffix
+    return filename
+
+
+def iter_log(f, name='log', chunksize=CHUNKSIZE):
+    '''Contents of a plain or compressed log (detected by content) from binary file object f, in pieces'''
+    head = f.read(len(ZSTD_MAGIC))
+    for magic in (GZIP_MAGIC, ZSTD_MAGIC):
+        if head.startswith(magic):
+            if magic == ZSTD_MAGIC and not zstandard:
+                raise RuntimeError('zstandard module required to read %s' % name)
+            f.seek(0)
+            for data in iter_members(f, magic, chunksize):
+                yield data
+            return
+    yield head
+    for data in iter(lambda: f.read(chunksize), b''):
+        yield data
+
+
+class LogStream(io.RawIOBase):
+    '''Read-only binary stream of the (decompressed) contents of a log file'''
+    def __init__(self, filename):
+        self.name = resolve(filename)
+        self.f = open(self.name, 'rb')
+        self.pieces = iter_log(self.f, self.name)
+        self.piece = b''
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.offset >= len(self.piece):
+            self.piece = next(self.pieces, None)
+            self.offset = 0
+            if self.piece is None:
+                self.piece = b''
+                return 0
+        n = min(len(b), len(self.piece) - self.offset)
+        b[:n] = self.piece[self.offset:self.offset + n]
+        self.offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+        super(LogStream, self).close()
+
+
+def read_log(filename):
+    '''
+    Contents of a log file, as bytes. Compressed logs are detected by content,
+    and filename may omit the .gz/.zst suffix. Use open_log() for large logs.
+    '''
+    filename = resolve(filename)
+    with open(filename, 'rb') as f:
+        return b''.join(iter_log(f, filename))
+
+
+def open_log(filename, encoding='UTF-8'):
+    '''Text mode file object for a plain or compressed log file, decompressing as it is read'''
+    return io.TextIOWrapper(io.BufferedReader(LogStream(filename)), encoding=encoding, errors='replace')
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print(__doc__.strip().split('\n')[-1])
+        sys.exit(0)
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    for name in sys.argv[1:]:
+        with open(resolve(name), 'rb') as f:
+            for data in iter_log(f, name):
+                out.write(data)
+        out.flush()
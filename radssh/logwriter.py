@@ -0,0 +1,169 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Log Writer Module
+Background thread for writing command results to the session log
+directory, so logging overlaps with command execution instead of
+running on the shell thread after the command completes.
+
+Consolidated logs (out.log, err.log) are kept open for the life of the
+writer, and per-host logs are kept in a bounded pool of open files.
+Output is filtered and prefixed a whole buffer at a time, rather than
+line by line, and the consolidated logs use large write buffers. Call barrier()
+to wait until everything submitted so far is written and flushed.
+
+With compression (gzip or zstd), log files get a .gz/.zst suffix and
+each barrier() completes a compressed member, so logs can be read (see
+radssh.logfile) as of the end of the last command. Per-host logs can be
+left uncompressed (compress_host_logs=False), for when they are also
+written directly as commands run, so each host's history stays in one file.
+
+If given a SessionLog, each result is also recorded in the structured
+session log, and each barrier() marks the end of a command.
+'''
+
+import os
+import re
+import threading
+import queue
+import logging
+from collections import OrderedDict
+
+from .logfile import CompressedLog, SUFFIX
+
+FILTER_TTY_ATTRS_RE = re.compile(b"\x1b\\[(\\d)+(;(\\d+))*m")
+
+
+class LogWriter(object):
+    '''Asynchronous writer of per-host and consolidated result logs'''
+    def __init__(self, logdir, log_out='out.log', log_err='err.log', encoding='UTF-8', max_open=128, buffering=1 << 20, session_log=None, compression='off',
+                 compress_host_logs=True):
+        self.logdir = logdir
+        self.log_out = log_out
+        self.log_err = log_err
+        self.encoding = encoding
+        self.max_open = max_open
+        self.buffering = buffering
+        self.session_log = session_log
+        self.compression = compression
+        self.compress_host_logs = compress_host_logs
+        self.files = OrderedDict()
+        self.q = queue.Queue()
+        # Filtered output for buffers seen since the last flush (shared by hosts with identical output)
+        self.filtered = {}
+        self.background_thread = threading.Thread(target=self.writer_thread, args=())
+        self.background_thread.daemon = True
+        self.background_thread.name = 'Log Writer'
+        self.background_thread.start()
+
+    def submit(self, host, job, command_header=True):
+        '''Queue a JobSummary for logging'''
+        self.q.put((host, job, command_header))
+
+    def barrier(self):
+        '''Wait for all submitted results to be written, and flush files'''
+        self.q.put(None)
+        self.q.join()
+
+    def open(self, filename):
+        '''File handle from the pool of open logs, closing the least recently used if needed'''
+        f = self.files.pop(filename, None)
+        if not f:
+            if len(self.files) >= self.max_open:
+                # Keep the consolidated logs open; evict a per-host log
+                for name in self.files:
+                    if name not in (self.log_out, self.log_err):
+                        self.files.pop(name).close()
+                        break
+            consolidated = filename in (self.log_out, self.log_err)
+            # Large buffers only for the consolidated logs, written for every host
+            buffering = self.buffering if consolidated else -1
+            path = os.path.join(self.logdir, filename)
+            if self.compression in SUFFIX and (consolidated or self.compress_host_logs):
+                f = CompressedLog(path + SUFFIX[self.compression], self.compression, buffering=buffering)
+            else:
+                f = open(path, 'ab', buffering)
+        self.files[filename] = f
+        return f
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        self.filtered.clear()
+        if self.session_log:
+            self.session_log.flush()
+
+    def close(self):
+        self.barrier()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        if self.session_log:
+            self.session_log.close()
+
+    def prefix_lines(self, label, data, cache=True):
+        '''Filter tty attributes and prefix every line with [label], in single passes over the buffer'''
+        filtered = self.filtered.get(data) if cache else None
+        if filtered is None:
+            filtered = FILTER_TTY_ATTRS_RE.sub(b'', data.strip()).decode(self.encoding, 'replace').encode(self.encoding)
+            if cache:
+                self.filtered[data] = filtered
+        prefix = ('[%s]' % label).encode(self.encoding)
+        return prefix + filtered.replace(b'\n', b'\n' + prefix) + b'\n'
+
+    def write(self, host, job, command_header=True):
+        '''Write a single host result to its logs (runs in writer thread)'''
+        label = str(host)
+        v = job.result
+        if getattr(v, 'file_backed', False):
+            # Host logs were written during execution; only the consolidated logs remain
+            header = ('[%s] === "%s" %s [%s] ===\n' % (label, v.command, v.status, v.return_code)).encode(self.encoding)
+            if self.log_out:
+                self.open(self.log_out).write(header + self.prefix_lines(label, v.stdout, False))
+            if self.log_err and v.stderr_range:
+                self.open(self.log_err).write(header + self.prefix_lines(label, v.stderr, False))
+        elif hasattr(v, 'stdout'):
+            header = ('=== "%s" %s [%s] ===\n' % (v.command, v.status, v.return_code)).encode(self.encoding)
+            if self.log_out:
+                self.open(self.log_out).write(b''.join([('[%s] ' % label).encode(self.encoding), header,
+                                                        self.prefix_lines(label, v.stdout)]))
+            f = self.open(label + '.log')
+            if command_header:
+                f.write(header)
+            f.write(v.stdout)
+            f.write(b'\n')
+            if v.stderr:
+                if self.log_err:
+                    self.open(self.log_err).write(b''.join([('[%s] ' % label).encode(self.encoding), header,
+                                                            self.prefix_lines(label, v.stderr)]))
+                f = self.open(label + '.stderr')
+                f.write(v.stderr)
+                f.write(b'\n')
+        else:
+            if self.log_err:
+                self.open(self.log_err).write(''.join(['[%s]%s\n' % (label, line) for line in str(v).split('\n')]).encode(self.encoding))
+            self.open(label + '.log').write(('%s\n' % str(v)).encode(self.encoding))
+
+    def writer_thread(self):
+        while True:
+            item = self.q.get()
+            try:
+                if item is None:
+                    self.flush()
+                else:
+                    self.write(*item)
+                    if self.session_log:
+                        self.session_log.record(*item[:2])
+            except Exception as e:
+                logging.getLogger('radssh').error('Log writer failed on %s: %r', item, e)
+            finally:
+                self.q.task_done()
@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Session Log Module
+Structured, indexed record of a session's command results, kept in the
+logdir alongside the plain text logs:
+
+    session.records - one JSON line per host result (command number, host,
+                      command, status, return code, start/end times, and
+                      the location of its stdout/stderr blobs)
+    session.blobs   - zlib compressed output, stored once per distinct
+                      (SHA-256) content no matter how many hosts produced it
+    session.index   - one JSON line per command, with the byte range of its
+                      records and a tally of return codes
+
+All three files are append only. Queries read the index to pick commands,
+read only those commands' records, and only decompress (once each) the
+blobs of records that pass the command/host/return code filters.
+
+Usage: python -m radssh.sessionlog <logdir> [command=PATTERN] [host=PATTERN] [rc=N] [grep=REGEX] [show=on]
+'''
+
+import os
+import re
+import json
+import zlib
+import fnmatch
+from collections import Counter, OrderedDict
+
+from .grouping import result_digest
+
+RECORDS = 'session.records'
+BLOBS = 'session.blobs'
+INDEX = 'session.index'
+# Decompressed blobs kept by a reader, most recently used
+BLOB_CACHE = 16
+
+
+class SessionLog(object):
+    '''Writer for the structured session log (used from the LogWriter thread)'''
+    def __init__(self, logdir, compresslevel=6):
+        self.logdir = logdir
+        self.compresslevel = compresslevel
+        self.records = open(os.path.join(logdir, RECORDS), 'ab')
+        self.blobs = open(os.path.join(logdir, BLOBS), 'ab')
+        self.index = open(os.path.join(logdir, INDEX), 'ab')
+        # digest => [offset, compressed length, size], rebuilt if reopening an existing session
+        self.stored = {}
+        self.seq = 0
+        for entry in SessionLogReader(logdir).records():
+            for stream in ('stdout', 'stderr'):
+                if entry.get(stream):
+                    self.stored[entry[stream][3]] = entry[stream][:3]
+            self.seq = max(self.seq, entry['seq'])
+        self.current = None
+
+    def store(self, data, digest):
+        '''Location [offset, length, size, digest] of data in the blob file, appending it if new'''
+        if not data:
+            return None
+        if digest not in self.stored:
+            compressed = zlib.compress(data, self.compresslevel)
+            self.stored[digest] = [self.blobs.tell(), len(compressed), len(data)]
+            self.blobs.write(compressed)
+        return self.stored[digest] + [digest]
+
+    def record(self, host, job):
+        '''Append a record for one host's JobSummary, starting a new command entry if needed'''
+        v = job.result
+        if not self.current:
+            self.seq += 1
+            self.current = {'seq': self.seq, 'command': getattr(v, 'command', None),
+                            'start': job.start_time, 'end': job.end_time,
+                            'offset': self.records.tell(), 'hosts': 0, 'return_codes': Counter()}
+        entry = {'seq': self.seq, 'host': str(host), 'start': job.start_time, 'end': job.end_time}
+        if hasattr(v, 'stdout'):
+            entry.update(command=v.command, status=v.status, rc=v.return_code,
+                         stdout=self.store(v.stdout, result_digest(v, 'stdout')),
+                         stderr=self.store(v.stderr, result_digest(v, 'stderr')))
+        else:
+            entry.update(command=None, status=v.__class__.__name__, rc=None, error=str(v))
+        self.records.write(json.dumps(entry, separators=(',', ':')).encode('ascii') + b'\n')
+        self.current['start'] = min(self.current['start'], job.start_time)
+        self.current['end'] = max(self.current['end'], job.end_time)
+        self.current['hosts'] += 1
+        self.current['return_codes'][str(entry['rc'] if entry['rc'] is not None else entry['status'])] += 1
+
+    def flush(self):
+        '''End the current command: write its index entry, and flush all files'''
+        if self.current:
+            self.current['length'] = self.records.tell() - self.current['offset']
+            self.index.write(json.dumps(self.current, separators=(',', ':')).encode('ascii') + b'\n')
+            self.current = None
+        for f in (self.blobs, self.records, self.index):
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in (self.blobs, self.records, self.index):
+            f.close()
+
+
+class SessionLogReader(object):
+    '''Query access to a structured session log'''
+    def __init__(self, logdir):
+        self.logdir = logdir
+        self.blob_cache = OrderedDict()
+        self.grep_cache = {}
+
+    def _lines(self, filename, offset=0, length=None):
+        try:
+            with open(os.path.join(self.logdir, filename), 'rb') as f:
+                f.seek(offset)
+                data = f.read() if length is None else f.read(length)
+        except IOError:
+            return
+        for line in data.splitlines():
+            try:
+                yield json.loads(line.decode('ascii'))
+            except ValueError:
+                # Partial line from an interrupted session
+                pass
+
+    def commands(self):
+        '''Index entries, one per command'''
+        return self._lines(INDEX)
+
+    def records(self, command=None):
+        '''All host records, or only those of an index entry'''
+        if command:
+            return self._lines(RECORDS, command['offset'], command['length'])
+        return self._lines(RECORDS)
+
+    def blob(self, location):
+        '''Decompressed content for a record's stdout/stderr location (recently used blobs are kept)'''
+        if not location:
+            return b''
+        offset, length, size, digest = location
+        data = self.blob_cache.pop(digest, None)
+        if data is None:
+            with open(os.path.join(self.logdir, BLOBS), 'rb') as f:
+                f.seek(offset)
+                data = zlib.decompress(f.read(length))
+            if len(self.blob_cache) >= BLOB_CACHE:
+                self.blob_cache.popitem(last=False)
+        self.blob_cache[digest] = data
+        return data
+
+    def query(self, command=None, host=None, rc=None, grep=None):
+        '''
+        Yield (index entry, record, matching lines) for records matching all given filters.
+        command is a command number or a fnmatch pattern for the command text,
+        host a fnmatch pattern, rc a return code, and grep a regex (bytes or str)
+        searched in stdout and stderr. Matching lines is None unless grep is given.
+        '''
+        if isinstance(grep, str):
+            grep = grep.encode('UTF-8')
+        pattern = re.compile(grep, re.MULTILINE) if grep else None
+        for entry in self.commands():
+            if isinstance(command, int):
+                if entry['seq'] != command:
+                    continue
+            elif command and not fnmatch.fnmatchcase(entry['command'] or '', command):
+                continue
+            if rc is not None and str(rc) not in entry['return_codes']:
+                continue
+            for r in self.records(entry):
+                if host and not fnmatch.fnmatchcase(r['host'], host):
+                    continue
+                if rc is not None and r['rc'] != rc:
+                    continue
+                lines = None
+                if pattern:
+                    lines = []
+                    for stream in ('stdout', 'stderr'):
+                        if r.get(stream):
+                            lines.extend(self.grep(pattern, r[stream]))
+                    if not lines:
+                        continue
+                yield entry, r, lines
+
+    def grep(self, pattern, location):
+        '''Lines of a blob matching pattern, searched once per blob'''
+        key = (pattern.pattern, location[3])
+        if key not in self.grep_cache:
+            data = self.blob(location)
+            lines = []
+            for match in pattern.finditer(data):
+                start = data.rfind(b'\n', 0, match.start()) + 1
+                end = data.find(b'\n', match.end())
+                line = data[start:end if end >= 0 else len(data)]
+                if not lines or lines[-1] != line:
+                    lines.append(line)
+            self.grep_cache[key] = lines
+        return self.grep_cache[key]
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print(__doc__.strip().split('\n')[-1])
+        sys.exit(0)
+    reader = SessionLogReader(sys.argv[1])
+    filters = dict([arg.split('=', 1) for arg in sys.argv[2:]])
+    show = filters.pop('show', 'off') == 'on'
+    if filters.get('command', '').isdigit():
+        filters['command'] = int(filters['command'])
+    if 'rc' in filters:
+        filters['rc'] = int(filters['rc'])
+    if not filters and not show:
+        for entry in reader.commands():
+            print('#%d %s (%d hosts, %.1fs) %s' % (
+                entry['seq'], entry['command'], entry['hosts'], entry['end'] - entry['start'],
+                ', '.join(['[%s]: %d' % x for x in sorted(entry['return_codes'].items())])))
+        sys.exit(0)
+    for entry, r, lines in reader.query(**filters):
+        print('#%d [%s] %s "%s" [%s]' % (entry['seq'], r['host'], r['status'], r['command'], r['rc']))
+        if 'error' in r:
+            print('  %s' % r['error'])
+        elif lines is None and show:
+            lines = []
+            for stream in ('stdout', 'stderr'):
+                if r.get(stream):
+                    lines.extend(reader.blob(r[stream]).split(b'\n'))
+        for line in lines or []:
+            print('  %s' % line.decode('UTF-8', 'replace'))
@@ -125,9 +125,7 @@ def shell(cluster, logdir=None, playbackfile=None, defaults=None):
                         cluster.console.message('Switched cluster from %r to %r' % (cluster, ret))
                         cluster = ret
                     continue
-                r = cluster.run_command(cmd)
-                if logdir:
-                    cluster.log_result(logdir, encoding=defaults['character_encoding'])
+                r = cluster.run_command(cmd, logdir=logdir)
                 # Quick summary report, if jobs failed
                 failures = {}
                 completions = []
@@ -341,7 +339,8 @@ def radssh_shell_main():
     # Make an AuthManager to handle user authentication
     a = ssh.AuthManager(defaults['username'],
                         auth_file=os.path.expanduser(defaults['authfile']),
-                        try_auth_none=(defaults['try_auth_none'] == 'on'))
+                        try_auth_none=(defaults['try_auth_none'] == 'on'),
+                        hints_file=defaults.get('auth_hints'))
 
     # Load Plugins to aid in host lookups and add *commands dynamically
     loaded_plugins = {}
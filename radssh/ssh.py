@@ -27,6 +27,8 @@ import hashlib
 import shlex
 import subprocess
 import queue
+import functools
+from collections import deque
 
 import paramiko
 
@@ -37,12 +39,24 @@ from .console import RadSSHConsole, user_password
 from . import known_hosts
 from . import config
 from .keepalive import KeepAlive, ServerNotResponding
+from .ssh_config import SSHConfigResolver
+from .dashboard import Dashboard
+from .grouping import OutputGroups, BlobStore, compress_hostlist
+from .logwriter import LogWriter, FILTER_TTY_ATTRS_RE
+from .sessionlog import SessionLog
+from .logfile import log_compression
+from .sync import sync_tree, local_inventory
+from .filestore import collect
+from .bandwidth import Bandwidth
+from .transfer import SharedSource, StreamSource, DeltaCache, upload, download, set_attributes, stream_command
 
 # If main thread gets KeyboardInterrupt, use this to signal
 # running background threads to terminate prior to command completion
 user_abort = threading.Event()
 
-FILTER_TTY_ATTRS_RE = re.compile(b"\x1b\\[(\d)+(;(\d+))*m")
+# Grouped output mode: seconds between updates of group host lists
+GROUP_UPDATE_INTERVAL = 2
+
 
 # Map ssh_config LogLevels to Python logging module levels
 # This may need some future adjustment, as the labels don't quite line up
@@ -103,6 +117,70 @@ class CommandResult(object):
         return '%s "%s" : [%s]' % (self.status, self.command, self.return_code)
 
 
+class FileBackedResult(CommandResult):
+    '''
+    CommandResult for output that was streamed to per-host log files during
+    execution. Output is read back from the files on access, rather than held
+    in memory. Ranges are (filename, start offset, length), or None if empty.
+    '''
+    file_backed = True
+
+    def __init__(self, stdout_range=None, stderr_range=None, **kwargs):
+        self.stdout_range = stdout_range
+        self.stderr_range = stderr_range
+        CommandResult.__init__(self, **kwargs)
+
+    @staticmethod
+    def read_range(file_range):
+        if not file_range:
+            return b''
+        filename, start, length = file_range
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    @property
+    def stdout(self):
+        return self.read_range(self.stdout_range)
+
+    @property
+    def stderr(self):
+        return self.read_range(self.stderr_range)
+
+
+class OrderedRelease(object):
+    '''
+    Release completed hosts in listed order. With a window set, at most that
+    many completed hosts are held back waiting on a slower host; past that,
+    the slow host gives up its place and is released whenever it completes.
+    '''
+    def __init__(self, window=0):
+        self.window = window
+        self.order = deque()
+        self.held = {}
+        self.skipped = set()
+
+    def add(self, host):
+        self.order.append(host)
+
+    def complete(self, host, job):
+        '''Record a completion, returning list of (host, job) now ready for output'''
+        if host in self.skipped:
+            self.skipped.discard(host)
+            return [(host, job)]
+        self.held[host] = job
+        ready = []
+        while self.order:
+            if self.order[0] in self.held:
+                head = self.order.popleft()
+                ready.append((head, self.held.pop(head)))
+            elif self.window and len(self.held) > self.window:
+                self.skipped.add(self.order.popleft())
+            else:
+                break
+        return ready
+
+
 class Chunker(object):
     '''Allow list of host connections to be chunkified into sublists'''
     def __init__(self, grouping=10, delay=30):
@@ -166,6 +244,23 @@ def run_local_command(original_name, remote_hostname, port, remote_username, ssh
     logging.getLogger('radssh').debug('LocalCommand "%s" completed with return code %d', cmd, p.wait())
 
 
+@functools.lru_cache(maxsize=None)
+def preferred_algorithms(option, spec, supported):
+    '''
+    Limit Paramiko supported algorithms (tuple) to those listed in ssh_config
+    option (Ciphers, KexAlgorithms, MACs) spec string. Cached, so each distinct
+    setting is only processed once, rather than once per Transport.
+    '''
+    logging.getLogger('radssh').debug('Limit %s to %s', option, spec)
+    preferred = []
+    for name in spec.split(','):
+        if name in supported:
+            preferred.append(name)
+        else:
+            logging.getLogger('radssh').debug('Ignoring %s %s (not supported by Paramiko)', option, name)
+    return tuple(preferred)
+
+
 def connection_worker(host, conn, auth, sshconfig={}):
     check_host_key = True
     # host is the label of the host, conn is the "real" name/ip to connect
@@ -193,39 +288,11 @@ def connection_worker(host, conn, auth, sshconfig={}):
         t = paramiko.Transport(s)
         t.setName(host)
 
-        ciphers = sshconfig.get('ciphers')
-        if ciphers:
-            logging.getLogger('radssh').debug('Limit Ciphers to %s', ciphers)
-            preferred = []
-            for name in ciphers.split(','):
-                if name in t._preferred_ciphers:
-                    preferred.append(name)
-                else:
-                    logging.getLogger('radssh').debug('Ignoring cipher %s (not supported by Paramiko)', name)
-            t._preferred_ciphers = tuple(preferred)
-            logging.getLogger('radssh').debug('Setting Paramiko _preferred_ciphers to %s', t._preferred_ciphers)
-        kex_algorithms = sshconfig.get('kexalgorithms')
-        if kex_algorithms:
-            logging.getLogger('radssh').debug('Limit KexAlgorithms to %s', kex_algorithms)
-            preferred = []
-            for name in kex_algorithms.split(','):
-                if name in t._preferred_kex:
-                    preferred.append(name)
-                else:
-                    logging.getLogger('radssh').debug('Ignoring KexAlgorithm %s (not supported by Paramiko)', name)
-            t._preferred_kex = tuple(preferred)
-            logging.getLogger('radssh').debug('Setting Paramiko _preferred_kex to %s', t._preferred_kex)
-        macs = sshconfig.get('macs')
-        if macs:
-            logging.getLogger('radssh').debug('Limit MACs to %s', macs)
-            preferred = []
-            for name in macs.split(','):
-                if name in t._preferred_macs:
-                    preferred.append(name)
-                else:
-                    logging.getLogger('radssh').debug('Ignoring MAC %s (not supported by Paramiko)', name)
-            t._preferred_macs = tuple(preferred)
-            logging.getLogger('radssh').debug('Setting Paramiko _preferred_macs to %s', t._preferred_macs)
+        for option, attr in (('ciphers', '_preferred_ciphers'), ('kexalgorithms', '_preferred_kex'), ('macs', '_preferred_macs')):
+            spec = sshconfig.get(option)
+            if spec:
+                setattr(t, attr, preferred_algorithms(option, spec, getattr(t, attr)))
+                logging.getLogger('radssh').debug('Setting Paramiko %s to %s', attr, getattr(t, attr))
     elif isinstance(conn, paramiko.Transport):
         # Reuse of established Transport, don't overwrite name
         # and don't bother doing host key verification
@@ -244,6 +311,9 @@ def connection_worker(host, conn, auth, sshconfig={}):
         logging.getLogger(t.get_log_channel()).setLevel(sshconfig_loglevels[loglevel.upper()])
     else:
         logging.getLogger('radssh').warning('Unknown LogLevel (%s) for %s', loglevel, host)
+    if not t.is_active() and sshconfig.get('compression', 'no').lower() == 'yes':
+        # Offer zlib (applied after authentication, with OpenSSH) ahead of none
+        t.use_compression(True)
 
     try:
         if check_host_key:
@@ -272,15 +342,30 @@ def connection_worker(host, conn, auth, sshconfig={}):
         return t
     # After connection and passing host key verification, now try to authenticate
     auth.authenticate(t, sshconfig)
+    logging.getLogger('radssh').debug('Compression for %s: %s', host, t.local_compression)
     return t
 
 
-def exec_command(host, t, cmd, quota, streamQ, encoding='UTF-8'):
-    '''Run a command across a transport via exec_cmd. Capture stdout, stderr, and return code, streaming to an optional output queue'''
+def exec_command(host, t, cmd, quota, streamQ, encoding='UTF-8', logdir=None, throttle=None, started=None):
+    '''
+    Run a command across a transport via exec_cmd. Capture stdout, stderr, and return code, streaming to an optional output queue.
+    If logdir is given, output is also written to the host log files as it arrives, and not kept in memory.
+    If throttle is given, output is read no faster than its rate limits allow.
+    If started is given, it is called with host as the command starts (once a dispatcher thread is free).
+    '''
+    if started:
+        started(host)
     return_code = None
     if isinstance(t, paramiko.Transport) and t.is_authenticated():
-        stdout = StreamBuffer(streamQ, (str(host), False), blocksize=2048, encoding=encoding)
-        stderr = StreamBuffer(streamQ, (str(host), True), blocksize=2048, encoding=encoding)
+        if logdir:
+            stdout_log = os.path.join(logdir, str(host) + '.log')
+            stderr_log = os.path.join(logdir, str(host) + '.stderr')
+            with open(stdout_log, 'ab') as f:
+                f.write(('=== "%s" ===\n' % cmd).encode(encoding))
+        else:
+            stdout_log = stderr_log = None
+        stdout = StreamBuffer(streamQ, (str(host), False), blocksize=2048, encoding=encoding, sink=stdout_log, abort=user_abort)
+        stderr = StreamBuffer(streamQ, (str(host), True), blocksize=2048, encoding=encoding, sink=stderr_log, abort=user_abort)
         keepalive = KeepAlive(t)
         # If transport has a persistent session (identified by being named same as the transport.remote_version)
         # then use the persistent session via send/recv to the shell quasi-interactively, rather than
@@ -321,11 +406,15 @@ def exec_command(host, t, cmd, quota, streamQ, encoding='UTF-8'):
         while not (stdout_eof and stderr_eof and s.exit_status_ready()):
             # Read from stdout socket
             s.settimeout(quiet_increment)
+            stdout_active = False
             try:
                 data = s.recv(16384)
                 quiet_time = 0
+                stdout_active = bool(data)
                 if data:
                     stdout.push(data)
+                    if throttle:
+                        throttle.consume(len(data))
                     if persistent_session:
                         if persist_prompt and persist_prompt in data:
                             stdout_eof = True
@@ -348,12 +437,15 @@ def exec_command(host, t, cmd, quota, streamQ, encoding='UTF-8'):
                     t.close()
                     process_completion = '*** Server Not Responding ***'
                     break
-            # Read from stderr socket, altered timeout
+            # Read from stderr socket, altered timeout (none while stdout is flowing,
+            # so bulk output is not held up waiting on an idle stderr)
             try:
-                s.settimeout(0.1)
+                s.settimeout(0.0 if stdout_active else 0.1)
                 data = s.recv_stderr(4096)
                 if data:
                     stderr.push(data)
+                    if throttle:
+                        throttle.consume(len(data))
                 else:
                     stderr_eof = True
             except socket.timeout:
@@ -384,32 +476,190 @@ def exec_command(host, t, cmd, quota, streamQ, encoding='UTF-8'):
         else:
             s.close()
         stdout.close()
-        if stdout.discards:
-            logging.getLogger('radssh').warning('StreamBuffer encountered %d discards', stdout.discards)
-            process_completion += 'StreamBuffer encountered %d discards' % stdout.discards
         stderr.close()
-        return CommandResult(command=cmd, return_code=return_code, status=process_completion, stdout=stdout.buffer, stderr=stderr.buffer)
+        if stdout.stalls or stderr.stalls:
+            logging.getLogger('radssh').debug('Console backpressure stalled output from %s (%d times)', host, stdout.stalls + stderr.stalls)
+        if logdir:
+            # Same layout as log_result, with the status trailing instead of leading the output
+            with open(stdout_log, 'ab') as f:
+                if not stdout.stripped:
+                    f.write(b'\n')
+                f.write(('=== "%s" %s [%s] ===\n' % (cmd, process_completion, return_code)).encode(encoding))
+            if stderr.sink_start is not None and not stderr.stripped:
+                with open(stderr_log, 'ab') as f:
+                    f.write(b'\n')
+            return FileBackedResult(command=cmd, return_code=return_code, status=process_completion,
+                                    stdout_range=(stdout_log, stdout.sink_start, len(stdout)) if stdout.sink_start is not None else None,
+                                    stderr_range=(stderr_log, stderr.sink_start, len(stderr)) if stderr.sink_start is not None else None,
+                                    stdout_digest=stdout.hexdigest(), stderr_digest=stderr.hexdigest())
+        return CommandResult(command=cmd, return_code=return_code, status=process_completion, stdout=stdout.buffer, stderr=stderr.buffer,
+                             stdout_digest=stdout.hexdigest(), stderr_digest=stderr.hexdigest())
     else:
         process_completion = '*** Skipped ***'
         return CommandResult(command=cmd, return_code=return_code, status=process_completion, stdout=b'', stderr=b'')
 
 
-def sftp_thread(host, t, srcfile, dstfile=None, attrs=None):
+def sftp_thread(host, t, srcfile, dstfile=None, attrs=None, digest=None, source=None, depth=None, streams=None,
+                remote_digest=None, deltas=None, throttle=None):
+    '''
+    SFTP put a file to a host, with pipelined writes (see radssh.transfer).
+    The file is read from source (a SharedSource) if given. If digest (SHA-256)
+    is given, the remote copy is checked against it, and the result is marked
+    verified if it matches. If remote_digest (of the existing remote file) is
+    given and matches digest, nothing is sent; if it differs and deltas (a
+    DeltaCache) is given, only the changed blocks are sent where possible.
+    Data sent is held within the rate limits of throttle, if given.
+    '''
     if not attrs:
         attrs = paramiko.sftp_attr.SFTPAttributes.from_stat(os.stat(srcfile))
-    s = t.open_sftp_client()
     if not dstfile:
         dstfile = srcfile
-    s.put(srcfile, dstfile)
-    s.chmod(dstfile, attrs.st_mode % 4096)
+    command = 'SFTP %s -> %s' % (srcfile, dstfile)
+    if digest and remote_digest == digest:
+        # Same content, but the permissions or ownership may still need fixing, as an upload would
+        s = paramiko.SFTPClient.from_transport(t)
+        try:
+            changed = set_attributes(s, dstfile, attrs, s.stat(dstfile))
+        finally:
+            s.close()
+        return CommandResult(command=command, return_code=0, status='*** Complete ***',
+                             stdout='Already up to date%s' % (' (attributes updated)' if changed else ''), stderr='',
+                             relay=None, verified=True)
+    sent = None
+    if deltas and remote_digest:
+        try:
+            sent = deltas.send(t, dstfile, remote_digest, attrs, throttle)
+        except IOError as e:
+            logging.getLogger('radssh').warning('%s - %s, sending full copy', str(host), e)
+    if sent is not None:
+        # Patch is checked against digest on the remote side
+        return CommandResult(command=command, return_code=0, status='*** Complete ***',
+                             stdout='Transferred %d of %d bytes (delta)' % (sent, attrs.st_size), stderr='',
+                             relay=None, verified=True)
+    upload(t, source or srcfile, dstfile, attrs, depth, streams, throttle=throttle)
+    verified = False
+    if digest:
+        remote_digest = remote_sha256(t, dstfile)
+        if remote_digest and remote_digest != digest:
+            raise IOError('SHA-256 mismatch on %s after transfer (%s)' % (dstfile, remote_digest))
+        verified = remote_digest == digest
+    return CommandResult(command=command, return_code=0, status='*** Complete ***',
+                         stdout='Transferred %d bytes' % attrs.st_size, stderr='',
+                         relay=None, verified=verified)
+
+
+def stream_thread(host, t, reader, srcfile, dstfile, attrs, depth=None, streams=None, throttle=None):
+    '''sftp_thread for a StreamReader, which gives up its place in the stream however the upload ends'''
+    try:
+        return sftp_thread(host, t, srcfile, dstfile, attrs, None, reader, depth, streams, throttle=throttle)
+    finally:
+        reader.close()
+
+
+def sync_thread(host, t, localdir, remotedir, local, channels, inflight, throttle=None):
+    '''Sync localdir to remotedir on a host (see radssh.sync), reporting what was sent'''
+    counts, errors = sync_tree(t, localdir, remotedir, local, channels, inflight, throttle)
+    summary = 'Sent %(sent)d files (%(bytes)d bytes), created %(directories)d directories, ' \
+        'updated permissions on %(chmods)d, %(unchanged)d unchanged' % counts
+    if counts['skipped']:
+        summary += ', %(skipped)d skipped' % counts
+    return CommandResult(command='SYNC %s -> %s' % (localdir, remotedir),
+                         return_code=1 if errors else 0, status='*** Complete ***',
+                         stdout='%s in %.2fs' % (summary, counts['seconds']),
+                         stderr='\n'.join(['%s: %s' % (path, e) for path, e in errors]))
+
+
+def get_thread(host, t, srcfile, dstfile, command=None, throttle=None):
+    '''
+    Fetch a file from a host straight into local file dstfile: srcfile via
+    SFTP, or if command is given, the output of command instead, within the
+    rate limits of throttle, if given. The result reports the bytes received
+    and throughput. A failed transfer leaves no local file.
+    '''
+    start = time.time()
+    stderr = b''
     try:
-        s.chown(dstfile, attrs.st_uid, attrs.st_gid)
-    except IOError:
-        pass
-    s.close()
+        if command:
+            return_code, received, stderr = stream_command(t, command, dstfile, throttle=throttle)
+        else:
+            return_code, received = 0, download(t, srcfile, dstfile, throttle=throttle)
+    except Exception:
+        if os.path.exists(dstfile):
+            os.unlink(dstfile)
+        raise
+    if return_code != 0 and os.path.exists(dstfile):
+        os.unlink(dstfile)
+    elapsed = max(time.time() - start, 0.001)
+    return CommandResult(command=command or 'SFTP %s <- %s' % (dstfile, srcfile),
+                         return_code=return_code, status='*** Complete ***',
+                         stdout='Received %d bytes in %.2fs (%.1f MB/s)' % (received, elapsed, received / 1e6 / elapsed),
+                         stderr=stderr, received=received)
+
+
+def collect_thread(host, t, paths, dstfiles, store, throttle=None):
+    '''Collect files from a host through a FileStore, reporting what had to be fetched'''
+    start = time.time()
+    fetched, outcome = collect(t, host, paths, dstfiles, store, throttle)
+    elapsed = max(time.time() - start, 0.001)
+    counts = dict([(how, len([x for x in outcome.values() if x == how])) for how in ('fetched', 'stored', 'unchanged')])
+    errors = ['%s: %s' % (path, e) for path, e in outcome.items() if isinstance(e, Exception)]
+    return CommandResult(command='COLLECT %s' % ' '.join(paths), return_code=1 if errors else 0, status='*** Complete ***',
+                         stdout='Received %d bytes in %.2fs (%.1f MB/s), %d files fetched, %d already stored, %d unchanged' % (
+                             fetched, elapsed, fetched / 1e6 / elapsed, counts['fetched'], counts['stored'], counts['unchanged']),
+                         stderr='\n'.join(errors).encode(), received=fetched)
+
+
+def file_sha256(filename, blocksize=1 << 20):
+    '''Hex SHA-256 of a local file'''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remote_sha256(t, path):
+    '''Hex SHA-256 of a remote file (via sha256sum), or None if it could not be run'''
+    chan = t.open_session()
+    chan.exec_command('sha256sum %s' % shlex.quote(path))
+    output = chan.makefile('rb').read()
+    if chan.recv_exit_status() != 0 or not output:
+        return None
+    return output.split()[0].decode('ascii', 'replace')
+
+
+def relay_thread(host, t, child, address, username, srcfile, dstfile, attrs, digest, relay_ssh):
+    '''
+    Have host relay its (verified) copy of dstfile to child over its own SSH
+    connection, using the controller's agent (forwarded over this channel) to
+    authenticate. The child's copy is written to a temporary file, moved into
+    place, then hashed by the child, and must match digest.
+    '''
+    port = 22
+    if isinstance(address, tuple):
+        address, port = address[:2]
+    partfile = '%s.radssh-part' % dstfile
+    receive = '; '.join([
+        'cat > %s && mv -f %s %s && chmod %o %s || exit 1' % (
+            shlex.quote(partfile), shlex.quote(partfile), shlex.quote(dstfile), attrs.st_mode % 4096, shlex.quote(dstfile)),
+        'chown %d:%d %s 2>/dev/null' % (attrs.st_uid, attrs.st_gid, shlex.quote(dstfile)),
+        'sha256sum %s' % shlex.quote(dstfile)])
+    ssh_cmd = relay_ssh % {'user': username, 'address': address, 'port': port}
+    chan = t.open_session()
+    paramiko.agent.AgentRequestHandler(chan)
+    chan.exec_command('%s %s < %s' % (ssh_cmd, shlex.quote(receive), shlex.quote(dstfile)))
+    output = chan.makefile('rb').read()
+    errors = chan.makefile_stderr('rb').read()
+    return_code = chan.recv_exit_status()
+    chan.close()
+    child_digest = output.split()[0].decode('ascii', 'replace') if output.strip() else None
+    if return_code != 0 or child_digest != digest:
+        raise IOError('Relay from %s to %s failed [%s] (SHA-256 %s): %s' % (
+            host, child, return_code, child_digest, errors.decode('UTF-8', 'replace').strip()))
     return CommandResult(command='SFTP %s -> %s' % (srcfile, dstfile),
                          return_code=0, status='*** Complete ***',
-                         stdout='Transferred %d bytes' % attrs.st_size, stderr='')
+                         stdout='Transferred %d bytes (relayed from %s)' % (attrs.st_size, host), stderr='',
+                         relay=host, verified=True)
 
 
 def close_connection(t, k, signoff=''):
@@ -445,6 +695,7 @@ class Cluster(object):
             self.defaults = config.load_default_settings()
         self.log_out = self.defaults.get('log_out', 'out.log').strip()
         self.log_err = self.defaults.get('log_err', 'err.log').strip()
+        self.log_writers = {}
         thread_count = min(int(self.defaults.get('max_threads')), len(hostlist))
         self.dispatcher = Dispatcher(outQ=queue.Queue(), threadpool_size=thread_count)
         self.pending = {}
@@ -457,10 +708,12 @@ class Cluster(object):
         self.last_result = None
         self.user_vars = {}
         self.quota = Quota(self.defaults)
+        self.bandwidth = Bandwidth(self.defaults)
         self.chunk_size = None
         self.chunk_delay = 0
         self.output_mode = self.defaults['output_mode']
         self.ordered_placeholder = self.defaults['ordered_placeholder']
+        self.ordered_window = int(self.defaults.get('ordered_window', 0))
         self.sshconfig = paramiko.SSHConfig()
         # Only load SSHConfig if path is set in RadSSH config
         if defaults.get('ssh_config'):
@@ -480,9 +733,12 @@ class Cluster(object):
                     self.sshconfig.parse(sysconfig)
             except IOError as e:
                 logging.getLogger('radssh').warning('Unable to process system ssh_config file (%s): %s', system_config, e)
+        self.sshconfig_resolver = SSHConfigResolver(self.sshconfig)
 
-        for label, conn in hostlist:
-            config = self.get_ssh_config(label, conn)
+        host_configs = [(label, conn, self.get_ssh_config(label, conn)) for label, conn in hostlist]
+        if self.defaults.get('preload_keys', 'on') == 'on':
+            self.preload_keys(host_configs)
+        for label, conn, config in host_configs:
             if mux:
                 for idx, mux_var in enumerate(mux.get(label, [])):
                     mux_label = '%s:%d' % (label, idx)
@@ -494,6 +750,26 @@ class Cluster(object):
         # Start remainder of dispatcher threads
         self.dispatcher.start_threads(len(self.connections))
 
+    def preload_keys(self, host_configs):
+        '''
+        Have AuthManager decode (and prompt for) every private key the hosts may
+        use, before connecting. Authfile keys are only included if their filter
+        matches one of the host names; keys filtered by IP address are left to
+        load when a connection first needs them, as addresses are not known yet.
+        '''
+        keyfiles = set()
+        allow_prompt = False
+        for label, conn, config in host_configs:
+            if isinstance(conn, paramiko.Transport) or config.get('pubkeyauthentication', 'yes') != 'yes':
+                continue
+            keyfiles.update(self.auth.identity_files(config))
+            if config.get('identitiesonly', 'no') == 'no':
+                keyfiles.update([k for f, k in self.auth.keys
+                                 if k in self.auth.deferred_keys and (not f or f.match(label))])
+            if config.get('batchmode', 'no') == 'no':
+                allow_prompt = True
+        self.auth.preload_keys(sorted(keyfiles), allow_prompt)
+
     def update_connections(self):
         '''Pull completed transport creations and save in connections dict'''
         while True:
@@ -507,7 +783,7 @@ class Cluster(object):
                         if transport.is_authenticated():
                             transport.set_keepalive(int(self.defaults.get('keepalive', 0)))
                             self.console.progress('.')
-                            logging.getLogger('radssh.connection').info('Authenticated to %s' % host)
+                            logging.getLogger('radssh.connection').info('Authenticated to %s (auth hint: %s)' % (host, getattr(transport, 'auth_hint', None)))
                             # IOS switch may require invoke_shell instead of exec_command
                             for id_string in self.defaults.get('force_tty', '').split(','):
                                 if id_string and id_string in transport.remote_version:
@@ -553,6 +829,7 @@ class Cluster(object):
                 new_dispatcher = Dispatcher(outQ=queue.Queue(), threadpool_size=self.dispatcher.threadpool_size)
                 self.dispatcher = new_dispatcher
                 break
+        self.auth.save_hints()
         self.console.progress('\n')
         self.console.status('Ready')
 
@@ -621,7 +898,7 @@ class Cluster(object):
                     supplied_port = None
         else:
             supplied_port = None
-        config = self.sshconfig.lookup(host_spec)
+        config = self.sshconfig_resolver.lookup(host_spec)
         # If spec included port or user, overrride the SSHConfig values
         if supplied_port:
             config['port'] = supplied_port
@@ -630,6 +907,9 @@ class Cluster(object):
         # if SSHConfig has no value for LogLevel, use the cluster setting
         if 'loglevel' not in config:
             config['loglevel'] = self.defaults['loglevel'].upper()
+        # Likewise for Compression
+        if 'compression' not in config:
+            config['compression'] = 'yes' if self.defaults.get('compression', 'off') == 'on' else 'no'
         return config
 
     def tunnel_connections(self, hostlist, jumpbox=None):
@@ -744,9 +1024,15 @@ class Cluster(object):
 
         return cmd
 
-    def run_command(self, template):
-        '''Execute a command line (template) string across all enabled host connections'''
+    def run_command(self, template, logdir=None):
+        '''
+        Execute a command line (template) string across all enabled host connections.
+        If logdir is given, results are logged in the background as they complete.
+        '''
         result = {}
+        writer = self.log_writer(logdir, self.defaults['character_encoding']) if logdir else None
+        # Optionally have host logs written during execution (see exec_command)
+        stream_logdir = logdir if self.defaults.get('log_stream', 'off') == 'on' else None
         last_interrupt = 0
         chunker = Chunker(self.chunk_size, self.chunk_delay)
         for k in self:
@@ -755,64 +1041,102 @@ class Cluster(object):
             chunker.add(k)
 
         total = len(chunker)
-        for chunk in chunker:
-            ordered_list = []
-            for k in chunk:
-                t = self.connections[k]
-                ordered_list.append(k)
-
-                # Patch up command line with host/mux specific data prior to queueing
-                cmd = self.prep_command(template, k)
-                if not cmd:
-                    continue
-                # Now we have a legit command line to execute
-                if self.output_mode == 'stream':
-                    self.pending[self.dispatcher.submit(exec_command, k, t, cmd, self.quota, self.console.q, self.defaults['character_encoding'])] = k
-                else:
-                    self.pending[self.dispatcher.submit(exec_command, k, t, cmd, self.quota, None, self.defaults['character_encoding'])] = k
-            # Wait for background jobs to complete
-            while self.pending:
-                try:
-                    self.console.status('Completed on %d/%d hosts' % (len(result), total))
-                    for pid, summary in self.dispatcher.async_results():
-                        host = self.pending.pop(pid)
-                        result[host] = summary
-                        if self.output_mode == 'ordered':
-                            while ordered_list and ordered_list[0] in result:
-                                host = ordered_list.pop(0)
-                                job = result[host]
-                                if job.result.stdout:
-                                    self.console.q.put(((host, False), job.result.stdout.decode(self.defaults['character_encoding'])))
-                                elif self.ordered_placeholder == 'on':
-                                    self.console.q.put(((host, False), '[No Output]'))
-                                if job.result.stderr:
-                                    self.console.q.put(((host, True), job.result.stderr.decode(self.defaults['character_encoding'])))
-                        else:
-                            ordered_list.remove(host)
-                        self.console.status('Completed on %d/%d hosts' % (len(result), total))
-
-                except UnfinishedJobs:
-                    pass
-                except KeyboardInterrupt:
-                    self.console.status('<Ctrl-C>')
-                    if time.time() - last_interrupt < 2.0:
-                        user_abort.set()
-                        # break
+        dashboard = None
+        if self.output_mode == 'dashboard':
+            dashboard = Dashboard(total, self.console)
+            dashboard.start()
+        groups = OutputGroups() if self.output_mode == 'grouped' else None
+        groups_shown = time.time()
+        blobs = BlobStore()
+        # Notices go through the dashboard while it owns the screen
+        notices = dashboard.q if dashboard else self.console.q
+        try:
+            for chunk in chunker:
+                ordered = OrderedRelease(self.ordered_window) if self.output_mode == 'ordered' else None
+                for k in chunk:
+                    t = self.connections[k]
+
+                    # Patch up command line with host/mux specific data prior to queueing
+                    cmd = self.prep_command(template, k)
+                    if not cmd:
+                        continue
+                    if ordered:
+                        ordered.add(k)
+                    # Now we have a legit command line to execute
+                    if self.output_mode == 'stream':
+                        streamQ = self.console.q
+                    elif dashboard:
+                        dashboard.submitted(k)
+                        streamQ = dashboard.q
                     else:
-                        last_interrupt = time.time()
-                        self.console.status('Completed on %d/%d hosts' % (len(result), total))
-                        self.console.q.put((('CONSOLE', True), '*** <Ctrl-C> ***'))
-                        in_flight = sorted([str(k) for k in self.pending.values() if k not in result])
-                        for host in in_flight:
-                            self.console.replay_recent(host)
-
-                        self.console.q.put((('CONSOLE', True), 'In-Flight commands running on %s' % str(in_flight)))
-                        self.console.q.put((('CONSOLE', True), 'To kill: Press <Ctrl-C> again within 2 seconds'))
-                except Exception as e:
-                    self.console.q.put((('EXCEPTION', True), '%s' % str(e)))
-            self.console.join()
-            self.console.status('Completed on %d/%d hosts' % (len(result), total))
-
+                        streamQ = None
+                    self.pending[self.dispatcher.submit(exec_command, k, t, cmd, self.quota, streamQ, self.defaults['character_encoding'], stream_logdir,
+                                                        self.bandwidth.host(k), dashboard.started if dashboard else None)] = k
+                # Wait for background jobs to complete
+                while self.pending:
+                    try:
+                        if not dashboard:
+                            self.console.status('Completed on %d/%d hosts' % (len(result), total))
+                        for pid, summary in self.dispatcher.async_results():
+                            host = self.pending.pop(pid)
+                            # Hosts with identical output share one copy
+                            blobs.intern_result(summary.result)
+                            result[host] = summary
+                            if writer:
+                                writer.submit(host, summary)
+                            if dashboard:
+                                dashboard.finished(host, summary)
+                            if groups is not None:
+                                self.show_grouped(groups, host, summary)
+                                if time.time() - groups_shown >= GROUP_UPDATE_INTERVAL:
+                                    self.show_group_hosts(groups)
+                                    groups_shown = time.time()
+                            if ordered:
+                                for host, job in ordered.complete(host, summary):
+                                    self.show_ordered(host, job)
+                            if not dashboard:
+                                self.console.status('Completed on %d/%d hosts' % (len(result), total))
+
+                    except UnfinishedJobs:
+                        pass
+                    except KeyboardInterrupt:
+                        if not dashboard:
+                            self.console.status('<Ctrl-C>')
+                        if time.time() - last_interrupt < 2.0:
+                            user_abort.set()
+                            # break
+                        else:
+                            last_interrupt = time.time()
+                            in_flight = sorted([str(k) for k in self.pending.values() if k not in result])
+                            notices.put((('CONSOLE', True), '*** <Ctrl-C> ***'))
+                            if groups is not None:
+                                # Attribute the output shown so far, in case this run is abandoned
+                                self.show_group_hosts(groups)
+                                groups_shown = time.time()
+                            if not dashboard:
+                                # The dashboard owns the screen while active, and already shows the slowest hosts
+                                self.console.status('Completed on %d/%d hosts' % (len(result), total))
+                                for host in in_flight:
+                                    self.console.replay_recent(host)
+                            notices.put((('CONSOLE', True), 'In-Flight commands running on %s' % str(in_flight)))
+                            notices.put((('CONSOLE', True), 'To kill: Press <Ctrl-C> again within 2 seconds'))
+                    except Exception as e:
+                        notices.put((('EXCEPTION', True), '%s' % str(e)))
+                if groups is not None:
+                    self.show_group_hosts(groups)
+                    groups_shown = time.time()
+                self.console.join()
+                if not dashboard:
+                    self.console.status('Completed on %d/%d hosts' % (len(result), total))
+        finally:
+            if dashboard:
+                # Always restore the terminal
+                dashboard.stop()
+        if groups is not None:
+            self.show_group_hosts(groups)
+        logging.getLogger('radssh').debug('Command results stored in %s', blobs)
+        if writer:
+            writer.barrier()
         self.console.status('Ready')
         # join(True) here causes the last_lines buffer to be cleared
         self.console.join(True)
@@ -820,73 +1144,326 @@ class Cluster(object):
         self.last_result = result
         return result
 
+    def show_ordered(self, host, job):
+        '''Ordered output mode: print a host's complete output'''
+        if not hasattr(job.result, 'stdout'):
+            self.console.q.put(((host, True), str(job.result)))
+            return
+        if job.result.stdout:
+            self.console.q.put(((host, False), job.result.stdout.decode(self.defaults['character_encoding'], 'replace')))
+        elif self.ordered_placeholder == 'on':
+            self.console.q.put(((host, False), '[No Output]'))
+        if job.result.stderr:
+            self.console.q.put(((host, True), job.result.stderr.decode(self.defaults['character_encoding'], 'replace')))
+
+    def show_grouped(self, groups, host, job):
+        '''Grouped output mode: print output only for the first host with each distinct result'''
+        n, first = groups.add(host, job)
+        if not first:
+            return
+        label = '#%d' % n
+        self.console.q.put(((label, True), '=== Output group %d (first seen on %s) ===' % (n, host)))
+        if not hasattr(job.result, 'stdout'):
+            self.console.q.put(((label, True), str(job.result)))
+            return
+        if job.result.stdout:
+            self.console.q.put(((label, False), job.result.stdout.decode(self.defaults['character_encoding'], 'replace')))
+        elif not job.result.stderr:
+            self.console.q.put(((label, False), '[No Output]'))
+        if job.result.stderr:
+            self.console.q.put(((label, True), job.result.stderr.decode(self.defaults['character_encoding'], 'replace')))
+
+    def show_group_hosts(self, groups):
+        '''Grouped output mode: print the updated host list of each group that gained hosts since last shown'''
+        for n, return_code, hosts in groups.changes():
+            self.console.q.put((('#%d' % n, False), '%d host%s [%s]: %s' % (
+                len(hosts), 's' if len(hosts) > 1 else '', return_code, compress_hostlist(hosts))))
+
+    def log_writer(self, logdir, encoding='UTF-8'):
+        '''Background LogWriter for logdir, kept for the life of the Cluster'''
+        key = (logdir, encoding)
+        if key not in self.log_writers:
+            session_log = SessionLog(logdir) if self.defaults.get('log_structured', 'off') == 'on' else None
+            compression = log_compression(self.defaults.get('log_compression', 'off'))
+            streamed = self.defaults.get('log_stream', 'off') == 'on'
+            if streamed and compression != 'off':
+                # Streamed host logs are plain files, so keep the rest of each host's log with them
+                logging.getLogger('radssh').warning(
+                    'log_stream is on: host logs are not compressed, only %s and %s', self.log_out, self.log_err)
+            self.log_writers[key] = LogWriter(logdir, self.log_out, self.log_err, encoding, session_log=session_log,
+                                              compression=compression, compress_host_logs=not streamed)
+        return self.log_writers[key]
+
     def log_result(self, logdir=None, command_header=True, encoding='UTF-8'):
         '''Save last_result content to a log directory - 1 file per host'''
         if logdir:
+            writer = self.log_writer(logdir, encoding)
             for k, job in self.last_result.items():
-                v = job.result
-                if isinstance(v, CommandResult):
-                    if self.log_out:
-                        lines = v.stdout.strip().split(b'\n')
-                        if lines:
-                            with open(os.path.join(logdir, self.log_out), 'ab') as f:
-                                f.write(('[%s] === "%s" %s [%s] ===\n' %
-                                        (str(k), v.command, v.status, v.return_code)).encode(encoding))
-                                for line in lines:
-                                    f.write(("[{0}]".format(str(k)) + filter_tty_attrs(line).decode(encoding, 'replace') + "\n").encode(encoding))
-                    with open(os.path.join(logdir, str(k) + '.log'), 'ab') as f:
-                        if command_header:
-                            f.write(('=== "%s" %s [%s] ===\n' %
-                                    (v.command, v.status, v.return_code)).encode(encoding))
-                        f.write(v.stdout)
-                        f.write(b'\n')
-                    if v.stderr:
-                        if self.log_err:
-                            lines = v.stderr.strip().split(b'\n')
-                            if lines:
-                                with open(os.path.join(logdir, self.log_err), 'ab') as f:
-                                    f.write(('[%s] === "%s" %s [%s] ===\n' %
-                                            (str(k), v.command, v.status, v.return_code)).encode(encoding))
-                                    for line in lines:
-                                        f.write(("[{0}]".format(str(k)) + filter_tty_attrs(line).decode(encoding, 'replace') + "\n").encode(encoding))
-                        with open(os.path.join(logdir, str(k) + '.stderr'), 'ab') as f:
-                            f.write(v.stderr)
-                            f.write(b'\n')
-                else:
-                    if self.log_err:
-                        lines = str(v).split('\n')
-                        if lines:
-                            with open(os.path.join(logdir, self.log_err), 'ab') as f:
-                                for line in lines:
-                                    f.write(("[{0}]".format(str(k)) + line + "\n").encode(encoding))
-                    with open(os.path.join(logdir, str(k) + '.log'), 'ab') as f:
-                        f.write(('%s\n' % str(v)).encode(encoding))
-
-    def sftp(self, src, dst=None, attrs=None):
-        '''SFTP a file (put) to all nodes'''
+                writer.submit(k, job, command_header)
+            writer.barrier()
+
+    def ready_hosts(self):
+        '''(host, transport) for each enabled host with an authenticated connection'''
         for k in self:
             t = self.connections[k]
             if k in self.disabled:
                 continue
             if not isinstance(t, paramiko.Transport) or not t.is_authenticated():
                 continue
-            self.pending[self.dispatcher.submit(sftp_thread, k, t, src, dst, attrs)] = k
-        total = len(self.pending)
-
-        result = {}
+            yield k, t
+
+    def _dispatch(self, jobs, interrupted, on_interrupt=None, report=True, result=None, total=None):
+        '''
+        Run jobs ({host: callable}) on the dispatcher, and wait for them all to
+        finish. Returns {host: JobSummary}, added to result if given. Unless
+        report is off, failures are shown as they come in, with progress (out
+        of total hosts, or the job count) on the status line. Ctrl-C shows the
+        interrupted message and calls on_interrupt, if given, then carries on
+        waiting, as running jobs cannot be cancelled.
+        '''
+        if result is None:
+            result = {}
+        if total is None:
+            total = len(jobs)
+        for k, job in jobs.items():
+            self.pending[self.dispatcher.submit(job)] = k
         while self.pending:
             try:
                 for pid, summary in self.dispatcher.async_results():
                     host = self.pending.pop(pid)
                     result[host] = summary
+                    if not report:
+                        continue
                     if not summary.completed:
                         self.console.message('%s - %s' % (str(host), repr(summary.result)), 'EXCEPTION')
-                    self.console.status('Completed on %d/%d hosts' % (total - len(self.pending), total))
+                    self.console.status('Completed on %d/%d hosts' % (len(result), total))
+            except UnfinishedJobs:
+                pass
+            except KeyboardInterrupt:
+                self.console.message(interrupted)
+                if on_interrupt:
+                    on_interrupt()
+                continue
+        return result
+
+    def sftp(self, src, dst=None, attrs=None, fanout=None):
+        '''SFTP a file (put) to all nodes, or distribute it through a relay tree if fanout is set'''
+        if fanout is None:
+            fanout = int(self.defaults.get('sftp.fanout', 0))
+        if fanout > 0:
+            return self.sftp_tree(src, dst, attrs, fanout)
+        # One shared reader of the local file for all hosts
+        source = SharedSource(src)
+        tuning = self.upload_tuning()
+        digest, remote, deltas = self.delta_check(src, dst or src, source)
+        jobs = {}
+        for k, t in self.ready_hosts():
+            jobs[k] = functools.partial(sftp_thread, k, t, src, dst, attrs, digest, source,
+                                        remote_digest=remote.get(k), deltas=deltas,
+                                        throttle=self.bandwidth.host(k), **tuning)
+        result = self._dispatch(jobs, '<Ctrl-C> SFTP Transfer ignored.')
+        source.close()
+        self.last_result = result
+        self.console.status('Ready')
+        return result
+
+    def sftp_stream(self, source_host, src, dst=None, ring_size=None):
+        '''
+        Copy a file from one host (source_host) to all other enabled hosts,
+        streaming it from the source host's SFTP session to all uploads at
+        once through a bounded ring of blocks (see radssh.transfer.StreamSource),
+        without a local copy. File attributes are preserved. Hosts are sent the
+        file in batches of up to the dispatcher thread count, with the file
+        read from the source host once per batch. Ctrl-C aborts the stream
+        (remaining batches are skipped).
+        '''
+        if not dst:
+            dst = src
+        if not ring_size:
+            ring_size = int(self.defaults.get('sftp.stream_buffer', 64)) << 20
+        t = self.connections[source_host]
+        s = paramiko.SFTPClient.from_transport(t)
+        attrs = s.stat(src)
+        s.close()
+        label = '%s:%s' % (source_host, src)
+        tuning = self.upload_tuning()
+        hosts = [k for k, t in self.ready_hosts() if k != source_host]
+        total = len(hosts)
+        batch_size = self.dispatcher.threadpool_size
+
+        result = {}
+        for start in range(0, len(hosts), batch_size):
+            if user_abort.is_set():
+                break
+            # Every upload in the ring must be running at once, or the ring could never move on
+            stream = StreamSource(attrs.st_size, ring_size, abort=user_abort)
+            readers = [(k, stream.reader()) for k in hosts[start:start + batch_size]]
+            stream.start(self.connections[source_host], src, throttle=self.bandwidth.host(source_host))
+            jobs = dict([(k, functools.partial(stream_thread, k, self.connections[k], reader, label, dst, attrs,
+                                               throttle=self.bandwidth.host(k), **tuning)) for k, reader in readers])
+            self._dispatch(jobs, '<Ctrl-C> Aborting stream from %s' % source_host, on_interrupt=user_abort.set,
+                           result=result, total=total)
+        user_abort.clear()
+        self.last_result = result
+        self.console.status('Ready')
+        return result
+
+    def sync(self, localdir, remotedir, channels=4, inflight=16):
+        '''
+        Sync a local directory tree to remotedir on all enabled hosts, sending
+        only what differs (see radssh.sync), over up to channels SFTP channels
+        per host with up to inflight files open on each
+        '''
+        local = local_inventory(localdir)
+        jobs = dict([(k, functools.partial(sync_thread, k, t, localdir, remotedir, local, channels, inflight,
+                                           self.bandwidth.host(k))) for k, t in self.ready_hosts()])
+        result = self._dispatch(jobs, '<Ctrl-C> Sync ignored.')
+        self.last_result = result
+        self.console.status('Ready')
+        return result
+
+    def get(self, src, dst, command=None):
+        '''
+        Fetch a file (SFTP get) from all enabled hosts, or the output of command
+        if given, streaming each straight to disk. dst is the local filename,
+        with %(host)s replaced by the host name.
+        '''
+        jobs = {}
+        for k, t in self.ready_hosts():
+            dstfile = dst.replace('%(host)s', str(k))
+            if not os.path.isdir(os.path.dirname(dstfile) or '.'):
+                os.makedirs(os.path.dirname(dstfile))
+            jobs[k] = functools.partial(get_thread, k, t, src, dstfile, command, self.bandwidth.host(k))
+        result = self._dispatch(jobs, '<Ctrl-C> File transfer ignored.')
+        self.last_result = result
+        self.console.status('Ready')
+        return result
+
+    def collect(self, paths, dst, store):
+        '''
+        Collect files from all enabled hosts through a FileStore, fetching only
+        content the store does not already have. dst is the local directory
+        for each host's copies, with %(host)s replaced by the host name.
+        '''
+        jobs = {}
+        for k, t in self.ready_hosts():
+            dstfiles = [os.path.join(dst.replace('%(host)s', str(k)), os.path.basename(path)) for path in paths]
+            jobs[k] = functools.partial(collect_thread, k, t, paths, dstfiles, store, self.bandwidth.host(k))
+        result = self._dispatch(jobs, '<Ctrl-C> File transfer ignored.')
+        store.save()
+        self.last_result = result
+        self.console.status('Ready')
+        return result
+
+    def upload_tuning(self):
+        '''SFTP upload request depth and channel count settings (None to tune from round trip time)'''
+        return {'depth': int(self.defaults.get('sftp.depth', 0)) or None,
+                'streams': int(self.defaults.get('sftp.streams', 0)) or None}
+
+    def delta_check(self, src, dst, source):
+        '''
+        Per sftp.skip_identical and sftp.delta settings, get the SHA-256 of the
+        existing remote copy of dst on each host. Returns the local digest (or
+        None if neither setting is on), the remote digests by host, and a
+        DeltaCache if deltas are to be sent. Hosts whose copy is identical are
+        skipped with either setting, as their delta would be empty.
+        '''
+        delta = self.defaults.get('sftp.delta', 'off') == 'on'
+        if not (delta or self.defaults.get('sftp.skip_identical', 'off') == 'on'):
+            return None, {}, None
+        digest = file_sha256(src)
+        jobs = dict([(k, functools.partial(remote_sha256, t, dst)) for k, t in self.ready_hosts()])
+        result = self._dispatch(jobs, '<Ctrl-C> SFTP Transfer ignored.', report=False)
+        remote = dict([(k, summary.result) for k, summary in result.items() if summary.completed and summary.result])
+        return digest, remote, DeltaCache(source, digest) if delta else None
+
+    def sftp_tree(self, src, dst=None, attrs=None, fanout=2):
+        '''
+        Distribute a file as a relay tree: the controller SFTPs it to up to
+        fanout hosts at a time, and every host whose copy is verified (SHA-256)
+        then relays it to up to fanout more hosts over its own SSH connection
+        to them. Hosts that cannot be reached via a relay (or whose relay fails)
+        are sent the file directly by the controller, as are hosts already up
+        to date or being sent a delta (see delta_check).
+        '''
+        if not dst:
+            dst = src
+        if not attrs:
+            attrs = paramiko.sftp_attr.SFTPAttributes.from_stat(os.stat(src))
+        source = SharedSource(src)
+        tuning = self.upload_tuning()
+        digest, remote, deltas = self.delta_check(src, dst, source)
+        if not digest:
+            digest = file_sha256(src)
+        relay_ssh = self.defaults.get('sftp.relay_ssh', 'ssh -o BatchMode=yes -p %(port)d %(user)s@%(address)s')
+        waiting = deque()
+        direct = deque()
+        addresses = {}
+        for k, t in self.ready_hosts():
+            try:
+                addresses[k] = t.getpeername()
+            except Exception:
+                addresses[k] = None
+            if remote.get(k) == digest or (deltas and k in remote):
+                # Already up to date, or cheaper to patch from here than relay a full copy
+                direct.appendleft(k)
+            elif addresses[k] and addresses[k][0]:
+                waiting.append(k)
+            else:
+                # Proxied connection, not reachable by other hosts
+                direct.append(k)
+        total = len(waiting) + len(direct)
+        # Free transfer slots per sender (None is the controller)
+        slots = {None: fanout}
+        active = {}
+        result = {}
+        while waiting or direct or self.pending:
+            # Relays take waiting hosts first, sparing the controller's uplink
+            for sender in sorted(slots, key=lambda x: x is None):
+                while slots[sender]:
+                    if sender is not None and waiting:
+                        k = waiting.popleft()
+                        pid = self.dispatcher.submit(relay_thread, sender, self.connections[sender], k, addresses[k],
+                                                     self.connections[k].get_username(), src, dst, attrs, digest, relay_ssh)
+                    elif sender is None and (direct or waiting):
+                        k = direct.popleft() if direct else waiting.popleft()
+                        pid = self.dispatcher.submit(sftp_thread, k, self.connections[k], src, dst, attrs, digest, source,
+                                                     remote_digest=remote.get(k), deltas=deltas,
+                                                     throttle=self.bandwidth.host(k), **tuning)
+                    else:
+                        break
+                    slots[sender] -= 1
+                    self.pending[pid] = k
+                    active[pid] = sender
+            try:
+                for pid, summary in self.dispatcher.async_results():
+                    host = self.pending.pop(pid)
+                    sender = active.pop(pid)
+                    if sender in slots:
+                        slots[sender] += 1
+                    if summary.completed:
+                        result[host] = summary
+                        if summary.result.verified:
+                            slots[host] = fanout
+                    elif sender is not None:
+                        # Relay failed: stop using that relay, and send this host its copy directly
+                        logging.getLogger('radssh').warning('%s - %s', str(host), repr(summary.result))
+                        slots.pop(sender, None)
+                        direct.append(host)
+                    else:
+                        result[host] = summary
+                        self.console.message('%s - %s' % (str(host), repr(summary.result)), 'EXCEPTION')
+                    self.console.status('Completed on %d/%d hosts' % (len(result), total))
+                    # Back to schedule transfers for any freed up or newly verified senders
+                    break
             except UnfinishedJobs:
                 pass
             except KeyboardInterrupt:
                 self.console.message('<Ctrl-C> SFTP Transfer ignored.')
                 continue
+        source.close()
+        relayed = len([x for x in result.values() if x.completed and x.result.relay])
+        self.console.message('%d of %d hosts received %s from a relay' % (relayed, len(result), dst))
         self.last_result = result
         self.console.status('Ready')
         return result
@@ -907,10 +1484,12 @@ class Cluster(object):
                 elif not t.is_authenticated():
                     bad.append((k, '(%7.3fs) Connected to %s / not authenticated' % (connect_time, t.getpeername()[0])))
                 else:
+                    message = '(%7.3fs) Authenticated as %s to %s' % (connect_time, t.get_username(), t.getpeername()[0])
+                    if getattr(t, 'auth_hint', None):
+                        message += ' [auth hint %s]' % t.auth_hint
                     if k in self.disabled:
-                        good.append((k, '(%7.3fs) Authenticated as %s to %s (Disabled)' % (connect_time, t.get_username(), t.getpeername()[0])))
-                    else:
-                        good.append((k, '(%7.3fs) Authenticated as %s to %s' % (connect_time, t.get_username(), t.getpeername()[0])))
+                        message += ' (Disabled)'
+                    good.append((k, message))
             else:
                 bad.append((k, '(%8.3fs) %s' % (connect_time, str(t))))
         return good + bad
@@ -933,6 +1512,17 @@ class Cluster(object):
                 failed_connect += 1
         return (ready, disabled, failed_auth, failed_connect, dropped)
 
+    def auth_hint_summary(self):
+        '''Count of connections where a saved auth hint was used (hit) or failed (miss)'''
+        hits = misses = 0
+        for t in self.connections.values():
+            hint = getattr(t, 'auth_hint', None)
+            if hint == 'hit':
+                hits += 1
+            elif hint == 'miss':
+                misses += 1
+        return (hits, misses)
+
     def locate(self, s):
         '''Lookup cluster entry - keys may be netaddr.IPAddress, not string'''
         # Trivial case, string to string match
@@ -957,3 +1547,6 @@ class Cluster(object):
             t = self.connections.pop(k)
             self.dispatcher.submit(close_connection, t, k, self.defaults.get('force_tty.signoff', ''))
         self.dispatcher.wait()
+        for writer in self.log_writers.values():
+            writer.close()
+        self.log_writers.clear()
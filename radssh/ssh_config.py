@@ -0,0 +1,151 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+SSH Config Resolver Module
+Faster per-host lookups against a parsed paramiko.SSHConfig, for clusters
+of many hosts against an ssh_config file with many Host stanzas.
+
+Host patterns are compiled once: stanzas listing only literal hostnames are
+indexed by name, and wildcard stanzas are reduced to a single regex each.
+The set of stanzas that apply to a host (its signature) determines the
+merged option dict, so merging is done once per unique signature, leaving
+only HostName injection and %token expansion as per-host work.
+
+Configs that use Match blocks or CanonicalizeHostname fall back to the
+regular paramiko.SSHConfig.lookup() call.
+'''
+
+import re
+import fnmatch
+import threading
+import logging
+from collections import defaultdict
+
+import paramiko
+
+WILDCARD_CHARS = re.compile(r'[*?\[]')
+
+
+class SSHConfigResolver(object):
+    '''Compiled (and cached) host lookups for a paramiko.SSHConfig'''
+    def __init__(self, sshconfig):
+        self.sshconfig = sshconfig
+        self.exact = defaultdict(list)
+        self.wildcard = []
+        self.merged = {}
+        self.lock = threading.Lock()
+        blocks = getattr(sshconfig, '_config', [])
+        # Match blocks depend on more than the hostname, so can't be precompiled
+        self.fallback = any('matches' in block for block in blocks)
+        for index, block in enumerate(blocks):
+            patterns = block.get('host', [])
+            if hasattr(patterns, 'split'):
+                patterns = patterns.split(',')
+            positive = [x for x in patterns if not x.startswith('!')]
+            negative = [x[1:] for x in patterns if x.startswith('!')]
+            if not negative and not any(WILDCARD_CHARS.search(x) for x in positive):
+                for name in positive:
+                    self.exact[name].append(index)
+            else:
+                self.wildcard.append((index, self.compile(positive), self.compile(negative)))
+        if not hasattr(sshconfig, '_tokenize'):
+            self.fallback = True
+
+    @staticmethod
+    def compile(patterns):
+        '''Combine a list of fnmatch patterns into one regex (or None if empty)'''
+        if not patterns:
+            return None
+        return re.compile('|'.join(['(?:%s)' % fnmatch.translate(x) for x in patterns]))
+
+    def signature(self, hostname):
+        '''Tuple of config stanza indexes (in file order) that apply to hostname'''
+        indexes = list(self.exact.get(hostname, []))
+        for index, positive, negative in self.wildcard:
+            if negative and negative.match(hostname):
+                continue
+            if positive and positive.match(hostname):
+                indexes.append(index)
+        return tuple(sorted(indexes))
+
+    def merge(self, signature):
+        '''Merged (unexpanded) options for a signature, following SSHConfig first-obtained-value rules'''
+        with self.lock:
+            if signature in self.merged:
+                return self.merged[signature]
+        options = {}
+        for index in signature:
+            for key, value in self.sshconfig._config[index]['config'].items():
+                if key not in options:
+                    options[key] = value[:] if value is not None else value
+                elif key == 'identityfile':
+                    options[key].extend(x for x in value if x not in options[key])
+        with self.lock:
+            self.merged[signature] = options
+        return options
+
+    def lookup(self, hostname):
+        '''Drop-in replacement for paramiko.SSHConfig.lookup()'''
+        if self.fallback:
+            return self.sshconfig.lookup(hostname)
+        merged = self.merge(self.signature(hostname))
+        if merged.get('canonicalizehostname') in ('yes', 'always'):
+            # Canonicalization does DNS lookups and a second pass - leave it to paramiko
+            return self.sshconfig.lookup(hostname)
+        options = paramiko.SSHConfigDict()
+        for key, value in merged.items():
+            options[key] = value[:] if isinstance(value, list) else value
+        if 'hostname' not in options:
+            options['hostname'] = hostname
+        # Only values with tokens need expansion; skip the per-key overhead for the rest
+        for key, value in list(options.items()):
+            if isinstance(value, list):
+                if any('%' in x or '~' in x for x in value):
+                    options[key] = [self.sshconfig._tokenize(options, hostname, key, x) for x in value]
+            elif value is not None and ('%' in value or '~' in value):
+                options[key] = self.sshconfig._tokenize(options, hostname, key, value)
+        return options
+
+    def __str__(self):
+        return '<%s: %d exact, %d wildcard stanzas, %d cached%s>' % (
+            self.__class__.__name__, len(self.exact), len(self.wildcard), len(self.merged),
+            ' (fallback)' if self.fallback else '')
+
+
+if __name__ == '__main__':
+    import sys
+    import os
+    import time
+    logging.basicConfig(level=logging.ERROR)
+    if len(sys.argv) < 2:
+        print('RadSSH SSH Config Resolver')
+        print('Usage: python -m radssh.ssh_config <ssh_config> [host ...]')
+        sys.exit(0)
+    config = paramiko.SSHConfig()
+    with open(os.path.expanduser(sys.argv[1])) as f:
+        config.parse(f)
+    resolver = SSHConfigResolver(config)
+    print(resolver)
+    hosts = sys.argv[2:] or ['host%05d.example.com' % x for x in range(2000)]
+    start = time.time()
+    for host in hosts:
+        expected = config.lookup(host)
+    paramiko_time = time.time() - start
+    start = time.time()
+    for host in hosts:
+        resolved = resolver.lookup(host)
+    resolver_time = time.time() - start
+    for host in hosts[:5]:
+        if dict(config.lookup(host)) != dict(resolver.lookup(host)):
+            print('Mismatch for %s:\n\t%s\n\t%s' % (host, config.lookup(host), resolver.lookup(host)))
+    print(resolver)
+    print('%d lookups: paramiko %.3fs, resolver %.3fs' % (len(hosts), paramiko_time, resolver_time))
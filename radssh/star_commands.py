@@ -32,6 +32,8 @@ import traceback
 import logging
 
 from .ssh import CommandResult
+from .filestore import FileStore
+from .bandwidth import parse_rate
 from .plugins import StarCommand
 
 forwarding_dest = ('127.0.0.1', 80)
@@ -83,10 +85,14 @@ def star_info(cluster, logdir, cmdline, *args):
         print('-' * 40)
         print('Disabled Nodes:')
         print(','.join([str(x) for x in cluster.disabled]))
+    hits, misses = cluster.auth_hint_summary()
+    if hits or misses:
+        print('Auth hints: %d hits, %d misses' % (hits, misses))
     star_quota(cluster, logdir, '')
     if cluster.output_mode == 'ordered':
-        print('Cluster output mode: ordered {} placeholders'.format(
-            'with' if cluster.ordered_placeholder == 'on' else 'without'))
+        print('Cluster output mode: ordered {} placeholders{}'.format(
+            'with' if cluster.ordered_placeholder == 'on' else 'without',
+            ', window of %d hosts' % cluster.ordered_window if cluster.ordered_window else ''))
     else:
         print('Cluster output mode: %s' % cluster.output_mode)
 
@@ -160,26 +166,53 @@ def star_result(cluster, logdir, cmdline, *args):
         cluster.console.q.put((('*result', False), 'Output saved to file "%s"' % outfile.strip()))
 
 
+def transfer_report(res):
+    '''Print per-host outcome (bytes and throughput) of a file collection'''
+    total = 0
+    for host, job in sorted(res.items(), key=lambda x: str(x[0])):
+        result = job.result
+        if not job.completed:
+            print('%s: Failed [%r]' % (host, result))
+        elif result.return_code != 0:
+            print('%s: Failed - Return Code [%s] %s' % (host, result.return_code, result.stderr.decode('UTF-8', 'replace').strip()))
+        else:
+            print('%s: %s' % (host, result.stdout))
+            total += result.received
+    print('Collected %d bytes from %d hosts' % (total, len(res)))
+
+
+# Characters the remote shell would expand or interpret in a path
+SHELL_SPECIAL = set('~*?[]{}$`\'"\\;&|<>()! \t\n')
+
+
+def needs_shell(path):
+    '''True if path has to be given to the remote shell (to cat) rather than fetched literally'''
+    return any([c in SHELL_SPECIAL for c in path])
+
+
 def star_get(cluster, logdir, cmdline, *args):
     '''Get a file or files from all enabled hosts'''
     save_res = cluster.last_result
-    save_mode = cluster.output_mode
-    cluster.output_mode = 'off'
     dest = os.path.join(logdir, 'files')
     print('Collecting files into %s' % os.path.abspath(dest))
 
-    for filename in args:
+    # Wildcards, variables, etc. need the remote shell to expand them
+    patterns = [x for x in args if needs_shell(x)]
+    paths = [x for x in args if x not in patterns]
+    if paths and cluster.defaults.get('get.store'):
+        # Only content not already in the store is fetched
+        print('Getting %s...' % ' '.join(paths))
+        transfer_report(cluster.collect(paths, os.path.join(dest, '%(host)s'), FileStore(cluster.defaults['get.store'])))
+        paths = []
+    for filename in paths + patterns:
         print('Getting %s...' % filename)
         namepart = os.path.split(filename)[1]
-        res = cluster.run_command('cat %s' % filename)
-        for host, job in res.items():
-            result = job.result
-            if job.completed and result.return_code == 0:
-                if not os.path.isdir(os.path.join(dest, str(host))):
-                    os.makedirs(os.path.join(dest, str(host)))
-                with open(os.path.join(dest, str(host), namepart), 'wb') as f:
-                    f.write(result.stdout)
-    cluster.output_mode = save_mode
+        dstfile = os.path.join(dest, '%(host)s', namepart)
+        if filename in patterns:
+            res = cluster.get(filename, dstfile, command='cat %s' % filename)
+        else:
+            res = cluster.get(filename, dstfile)
+        transfer_report(res)
     cluster.last_result = save_res
 
 
@@ -254,8 +287,8 @@ def star_forward(cluster, logdir, cmdline, *args):
 
 
 def star_output_mode(cluster, logdir, cmdline, *args):
-    '''Select output mode: [stream|ordered|off]'''
-    modes = ('stream', 'ordered', 'off')
+    '''Select output mode: [stream|ordered|grouped|dashboard|off]'''
+    modes = ('stream', 'ordered', 'grouped', 'dashboard', 'off')
     if args[0] not in modes:
         raise ValueError('Output mode must be one of: %s' % repr(modes))
     cluster.output_mode = args[0]
@@ -286,6 +319,22 @@ def star_quota(cluster, logdir, cmdline, *args):
         print('\tOutput Byte Limit: Unlimited')
 
 
+def star_bandwidth(cluster, logdir, cmdline, *args):
+    '''Print or set bandwidth limits (MB/s)'''
+    if args:
+        try:
+            cluster.bandwidth.total_limit = parse_rate(args[0])
+            cluster.bandwidth.host_limit = parse_rate(args[1])
+        except IndexError:
+            pass
+    print('Current Bandwidth Limits:')
+    for label, limit in (('Total', cluster.bandwidth.total_limit), ('Per Host', cluster.bandwidth.host_limit)):
+        if limit:
+            print('\t%s: %g MB/s' % (label, limit / 1e6))
+        else:
+            print('\t%s: Unlimited' % label)
+
+
 def star_vars(cluster, logdir, cmdline, *args):
     '''View or set user-defined session variables'''
     if not args:
@@ -328,6 +377,7 @@ commands = {
     '*sh': StarCommand(star_shell, max_args=0),
     '*output': StarCommand(star_output_mode, min_args=1, max_args=1),
     '*quota': StarCommand(star_quota),
+    '*bandwidth': StarCommand(star_bandwidth, max_args=2),
     '*fwd': StarCommand(star_forward, max_args=2),
     '*vars': StarCommand(star_vars, max_args=1),
     '*chunk': StarCommand(star_chunk, max_args=2),
@@ -15,14 +15,32 @@ Class definition for converting a stream of input data into chunks,
 typically newline delimited, into a python queue object. Pushed
 data is acculumulated and delivered to the queue per selectable
 thresholds.
+
+Delivery is lossless: if the queue is full, undelivered data is held
+in the buffer and merged into the next delivery. If the held backlog
+exceeds the credit (bytes), push() blocks on the queue, which stalls the
+caller's reads and lets the SSH channel window throttle the remote end.
+Blocked waits poll an optional abort event (threading.Event), and give up
+(leaving the data held) once it is set, so a stalled caller can still be
+interrupted while the queue is not being drained.
+
+With a sink (filename), pushed data is also appended to that file as it
+arrives, and only data not yet delivered to the queue (or digested) is
+kept in memory. Positions (marker, pull_marker) remain absolute; offset
+is the position of the first byte still held in buffer.
 '''
 
 import queue
+import hashlib
+
+# Seconds between checks of the abort event while waiting on a full queue
+POLL = 0.5
 
 
 class StreamBuffer(object):
     '''StreamBuffer Class'''
-    def __init__(self, queue=None, tag=None, delimiter=b'\n', blocksize=1024, presplit=False, encoding='utf-8'):
+    def __init__(self, queue=None, tag=None, delimiter=b'\n', blocksize=1024, presplit=False, encoding='utf-8', credit=65536, sink=None,
+                 abort=None):
         if tag:
             self.tag = tag
         else:
@@ -32,13 +50,23 @@ class StreamBuffer(object):
         self.blocksize = blocksize
         # Local data: empty buffer with reset marker position
         self.buffer = bytes()
+        self.offset = 0
         self.marker = 0
         self.pull_marker = 0
         self.line_count = 0
         self.active = True
-        self.discards = 0
         self.pre_split = presplit
         self.encoding = encoding
+        self.credit = credit
+        self.abort = abort
+        self.stalls = 0
+        # Running SHA-256 of buffer content (as it will be after close)
+        self.digest = hashlib.sha256()
+        self.digested = 0
+        # Optional file copy of all data; opened on first data
+        self.sink = sink
+        self.sink_file = None
+        self.sink_start = None
 
     def push(self, data):
         '''Appends data to buffer, and adds records (lines of text) to queue'''
@@ -50,70 +78,130 @@ class StreamBuffer(object):
             data = data.encode(self.encoding, 'xmlcharrefreplace')
         if data:
             self.buffer += data
-            if len(self.buffer) - self.marker > self.blocksize:
+            self.update_digest()
+            if self.sink:
+                self.write_sink(data)
+            if len(self) - self.marker > self.blocksize:
                 flush_needed = True
         else:
             # If empty push call, and there is queued data, flush what we collected
             # regardless of blocksize length specified
-            if len(self.buffer) - self.marker > 0:
+            if len(self) - self.marker > 0:
                 flush_needed = True
 
         if self.queue and flush_needed:
-            pending = self.buffer[self.marker:]
+            # Only wait on the queue once this host has used up its credit
+            block = self.credit is not None and len(self) - self.marker > self.credit
+            if block:
+                self.stalls += 1
+            self.flush(block)
+        if self.sink:
+            self.trim()
+
+    def write_sink(self, data):
+        if not self.sink_file:
+            self.sink_file = open(self.sink, 'ab')
+            self.sink_start = self.sink_file.tell()
+        self.sink_file.write(data)
+        self.sink_file.flush()
+
+    def trim(self):
+        '''Drop data that is safely in the sink file, and no longer needed for delivery or digest'''
+        keep = min(self.marker, self.digested) if self.queue else self.digested
+        if keep > self.offset:
+            self.buffer = self.buffer[keep - self.offset:]
+            self.offset = keep
+            self.pull_marker = max(self.pull_marker, keep)
+
+    def put(self, item, block=False):
+        '''Put item on the queue, waiting (if block) until there is room or abort is set; raises queue.Full if not put'''
+        while True:
+            aborted = self.abort is not None and self.abort.is_set()
+            try:
+                self.queue.put(item, block and not aborted, POLL)
+                return
+            except queue.Full:
+                if not block or aborted:
+                    raise
+
+    def flush(self, block=False):
+        '''Deliver complete lines to the queue; if full (and not blocking) leave them held for later'''
+        pending = self.buffer[self.marker - self.offset:]
+        try:
             if self.pre_split:
                 # Put multiple items on queue
                 # split on delimiter before queueing
                 lines = pending.split(self.delimiter)
                 for x in lines[0:-1]:
+                    self.put((self.tag, x.decode(self.encoding, 'replace')), block)
                     self.line_count += 1
-                    try:
-                        self.queue.put_nowait((self.tag, x.decode(self.encoding, 'replace')))
-                    except queue.Full:
-                        self.discards += 1
-                # Place back to a partial last line
-                self.marker = len(self.buffer) - len(lines[-1])
+                    self.marker += len(x) + len(self.delimiter)
             else:
                 # put single item on queue
                 # reader will be responsible for splitting
                 pos = pending.rfind(self.delimiter)
                 if pos >= 0:
-                    try:
-                        self.queue.put_nowait((self.tag, pending[:pos].decode(self.encoding, 'replace')))
-                    except queue.Full:
-                        self.discards += 1
+                    self.put((self.tag, pending[:pos].decode(self.encoding, 'replace')), block)
                     self.line_count += pending[:pos].count(self.delimiter)
                     self.marker += 1 + pos
+        except queue.Full:
+            # Held in buffer (marker not advanced), merged into a later delivery
+            pass
+
+    def update_digest(self):
+        '''Feed new data to the digest, holding back a trailing delimiter that close() may strip'''
+        end = len(self)
+        if self.buffer.endswith(self.delimiter):
+            end -= len(self.delimiter)
+        if end > self.digested:
+            self.digest.update(self.buffer[self.digested - self.offset:end - self.offset])
+            self.digested = end
+
+    def hexdigest(self):
+        '''SHA-256 of the buffer content, without rehashing the whole buffer'''
+        return self.digest.hexdigest()
 
     def pull(self, size=0):
         '''Non-queue access to accumulated data as bytes'''
-        if not self.active and self.pull_marker == len(self.buffer):
+        if not self.active and self.pull_marker == len(self):
             raise EOFError
-        data = self.buffer[self.pull_marker:]
-        if size == 0 or self.pull_marker + size <= len(self.buffer):
+        data = self.buffer[self.pull_marker - self.offset:]
+        if size == 0 or self.pull_marker + size <= len(self):
             # Return all pending data
-            self.pull_marker = len(self.buffer)
+            self.pull_marker = len(self)
             return data
         self.pull_marker += size
         return data[:size]
 
     def rewind(self, position=0):
-        if position < 0 or position > len(self.buffer):
-            raise ValueError('Invalid rewind position %d: only range [0:%d] exists' % (position, len(self.buffer)))
+        if position < self.offset or position > len(self):
+            raise ValueError('Invalid rewind position %d: only range [%d:%d] exists' % (position, self.offset, len(self)))
         self.pull_marker = position
 
     def close(self):
         '''Signal end of writes - flushes queue but saves position for further pulls'''
-        if self.buffer and self.buffer[-1:] == self.delimiter:
+        self.stripped = bool(self.buffer) and self.buffer[-1:] == self.delimiter
+        if self.stripped:
             self.buffer = self.buffer[:-1]
-        if self.queue and len(self.buffer) > self.marker:
-            self.push(b'')
-            if len(self.buffer) > self.marker:
+        if len(self) > self.digested:
+            self.digest.update(self.buffer[self.digested - self.offset:])
+            self.digested = len(self)
+        if self.queue and len(self) > self.marker:
+            self.flush(block=True)
+            if len(self) > self.marker:
                 # Flush partial last line
-                pending = self.buffer[self.marker:]
-                self.queue.put((self.tag, pending.decode(self.encoding, 'replace')))
-                self.line_count += 1
-        self.marker = len(self.buffer)
+                pending = self.buffer[self.marker - self.offset:]
+                try:
+                    self.put((self.tag, pending.decode(self.encoding, 'replace')), True)
+                    self.line_count += 1
+                except queue.Full:
+                    # Aborted; the data is still in the buffer (and sink)
+                    pass
+        self.marker = len(self)
         self.active = False
+        if self.sink_file:
+            self.sink_file.close()
+            self.trim()
 
     def __iter__(self):
         '''Yield lines of text from accumulated bytes in buffer'''
@@ -121,8 +209,8 @@ class StreamBuffer(object):
             yield x.decode(self.encoding, 'replace')
 
     def __len__(self):
-        '''Count of bytes (not characters) in buffer'''
-        return len(self.buffer)
+        '''Count of bytes (not characters) pushed into buffer (including any trimmed)'''
+        return self.offset + len(self.buffer)
 
     def __str__(self):
         return '<%s-%s>' % (self.__class__.__name__, self.tag)
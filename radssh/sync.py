@@ -0,0 +1,337 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Sync Module
+Bring a remote directory tree in line with a local one (*sync).
+
+The remote side is inventoried in bulk, with a single find command (or
+SFTP directory listings where GNU find is not available), and compared
+with the local inventory by type, size, modification time, and
+permissions. Only files that differ are sent; directories are created,
+and permissions of otherwise unchanged entries updated, as needed.
+Files and directories on the remote side that are not in the local tree
+are left alone.
+
+Rather than a put, chmod, and utime in turn for each file (several round
+trips apiece), every operation is an asynchronous SFTP request: each of a
+small pool of SFTP channels keeps several files open at once, and their
+writes, close, and attribute update (permissions and modification time,
+in one request) are all sent without waiting for replies, so a tree of
+thousands of small files costs little more than a handful of round trips.
+'''
+
+import os
+import stat
+import time
+import shlex
+import select
+import posixpath
+import functools
+from collections import deque
+
+import paramiko
+from paramiko.sftp import (CMD_OPEN, CMD_CLOSE, CMD_WRITE, CMD_MKDIR, CMD_SETSTAT, CMD_STATUS, CMD_HANDLE,
+                           SFTP_FLAG_WRITE, SFTP_FLAG_CREATE, SFTP_FLAG_TRUNC, int64)
+
+from .transfer import SharedSource, BLOCKSIZE, remote_run
+
+CHANNELS = 4
+# Files open at once per channel, and write requests outstanding per channel
+INFLIGHT = 16
+DEPTH = 64
+# Seconds without a response from the host before giving up
+TIMEOUT = 60
+FIND_INVENTORY = "find %s -mindepth 1 -printf '%%y %%s %%T@ %%m %%P\\0'"
+
+
+def local_inventory(localdir):
+    '''
+    {relative path: (type, size, mtime, permissions)} of everything under
+    localdir. Type is d (directory), f (regular file), or l (symlink).
+    '''
+    inventory = {}
+    for dirpath, dirnames, filenames in os.walk(localdir):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                kind = 'l'
+            elif stat.S_ISDIR(st.st_mode):
+                kind = 'd'
+            elif stat.S_ISREG(st.st_mode):
+                kind = 'f'
+            else:
+                kind = '?'
+            inventory[os.path.relpath(path, localdir).replace(os.sep, '/')] = (
+                kind, st.st_size, int(st.st_mtime), st.st_mode & 0o7777)
+    return inventory
+
+
+def remote_inventory(t, remotedir):
+    '''local_inventory() of remotedir over transport t, or None if it does not exist'''
+    return_code, stdout, stderr = remote_run(t, FIND_INVENTORY % shlex.quote(remotedir))
+    if return_code == 0 or stdout:
+        inventory = {}
+        for record in stdout.split(b'\0'):
+            if record:
+                kind, size, mtime, mode, path = record.decode('UTF-8', 'replace').split(' ', 4)
+                inventory[path] = (kind, int(size), int(float(mtime)), int(mode, 8))
+        return inventory
+    # No GNU find (or no such directory); walk it with SFTP directory listings
+    s = paramiko.SFTPClient.from_transport(t)
+    try:
+        try:
+            s.stat(remotedir)
+        except IOError:
+            return None
+        inventory = {}
+        pending = ['']
+        while pending:
+            parent = pending.pop()
+            for attrs in s.listdir_attr(posixpath.join(remotedir, parent)):
+                path = posixpath.join(parent, attrs.filename)
+                if stat.S_ISLNK(attrs.st_mode):
+                    kind = 'l'
+                elif stat.S_ISDIR(attrs.st_mode):
+                    kind = 'd'
+                    pending.append(path)
+                elif stat.S_ISREG(attrs.st_mode):
+                    kind = 'f'
+                else:
+                    kind = '?'
+                inventory[path] = (kind, attrs.st_size, int(attrs.st_mtime), attrs.st_mode & 0o7777)
+        return inventory
+    finally:
+        s.close()
+
+
+def sync_plan(local, remote):
+    '''
+    Compare inventories; returns (directories to create, files to send,
+    paths whose permissions alone need updating, paths skipped), each sorted
+    so that parent directories come first.
+    '''
+    mkdirs = []
+    sends = []
+    chmods = []
+    skipped = []
+    for path in sorted(local):
+        kind, size, mtime, mode = local[path]
+        existing = remote.get(path)
+        if kind not in ('d', 'f') or (existing and existing[0] != kind):
+            # Symlinks and special files are not synced, nor is a file replaced by a directory (or vice versa)
+            skipped.append(path)
+        elif not existing:
+            (mkdirs if kind == 'd' else sends).append(path)
+        elif kind == 'f' and (existing[1] != size or existing[2] != mtime):
+            sends.append(path)
+        elif existing[3] != mode:
+            chmods.append(path)
+    return mkdirs, sends, chmods, skipped
+
+
+def sync_attrs(mode, mtime=None):
+    attrs = paramiko.SFTPAttributes()
+    attrs.st_mode = mode
+    if mtime is not None:
+        attrs.st_atime = attrs.st_mtime = mtime
+    return attrs
+
+
+class SyncFile(object):
+    '''A file being sent, and where it is up to'''
+    def __init__(self, localfile, remotefile, size, mtime, mode):
+        self.localfile = localfile
+        self.remotefile = remotefile
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
+        self.source = None
+        self.handle = None
+        self.offset = 0
+        self.failed = False
+
+
+class SyncChannel(object):
+    '''
+    One SFTP channel of a sync: files queued on it are opened up to inflight
+    at a time, and all their requests are sent without waiting for replies,
+    with up to depth writes outstanding, within the rate limits of throttle,
+    if given. Replies are handled as they arrive.
+    '''
+    def __init__(self, t, inflight=INFLIGHT, depth=DEPTH, blocksize=BLOCKSIZE, throttle=None):
+        self.sftp = paramiko.SFTPClient.from_transport(t)
+        self.throttle = throttle
+        self.inflight = inflight
+        self.depth = depth
+        self.blocksize = blocksize
+        self.queue = deque()
+        self.writing = deque()
+        self.opened = 0
+        self.writes = 0
+        self.expecting = {}
+        self.sent = 0
+        self.sent_bytes = 0
+        self.errors = []
+
+    def request(self, callback, kind, *args):
+        self.expecting[self.sftp._async_request(self, kind, *args)] = callback
+
+    def _async_response(self, t, msg, num):
+        # Called by paramiko from _read_response(), for replies to request()
+        callback = self.expecting.pop(num)
+        if t == CMD_STATUS:
+            try:
+                # Raises IOError unless the status is OK
+                self.sftp._convert_status(msg)
+            except (IOError, paramiko.SFTPError) as e:
+                t, msg = None, e
+        callback(t, msg)
+
+    def busy(self):
+        return bool(self.queue or self.writing or self.expecting)
+
+    def pump(self):
+        '''Send all the requests there is room for'''
+        while self.queue and self.opened < self.inflight:
+            f = self.queue.popleft()
+            try:
+                f.source = SharedSource(f.localfile)
+            except (IOError, OSError) as e:
+                self.errors.append((f.localfile, e))
+                continue
+            # The inventory may be out of date (and is shared by all hosts), so send what the file has now
+            f.size = f.source.size
+            self.opened += 1
+            self.request(functools.partial(self.on_open, f), CMD_OPEN, f.remotefile,
+                         SFTP_FLAG_WRITE | SFTP_FLAG_CREATE | SFTP_FLAG_TRUNC, sync_attrs(f.mode))
+        while self.writing and self.writes < self.depth:
+            f = self.writing[0]
+            if f.offset < f.size:
+                data = f.source.read(f.offset, self.blocksize)
+                if not len(data):
+                    # Shrank since it was opened: give up on it, rather than send empty writes forever
+                    self.writing.popleft()
+                    f.failed = True
+                    self.errors.append((f.localfile, IOError('File shrank while being sent')))
+                    self.request(functools.partial(self.on_close, f), CMD_CLOSE, f.handle)
+                    continue
+                if self.throttle:
+                    self.throttle.consume(len(data))
+                self.request(self.on_write, CMD_WRITE, f.handle, int64(f.offset), data)
+                self.writes += 1
+                f.offset += len(data)
+            if f.offset >= f.size:
+                # Server handles requests in order, so close (and setstat) follow the writes
+                self.writing.popleft()
+                self.request(functools.partial(self.on_close, f), CMD_CLOSE, f.handle)
+                self.request(functools.partial(self.on_status, f.remotefile), CMD_SETSTAT, f.remotefile,
+                             sync_attrs(f.mode, f.mtime))
+
+    def on_open(self, f, t, msg):
+        if t != CMD_HANDLE:
+            self.opened -= 1
+            f.source.close()
+            self.errors.append((f.remotefile, msg))
+            return
+        f.handle = msg.get_binary()
+        self.writing.append(f)
+
+    def on_write(self, t, msg):
+        self.writes -= 1
+        if t is None:
+            self.errors.append(('write', msg))
+
+    def on_close(self, f, t, msg):
+        self.opened -= 1
+        f.source.close()
+        if t is None:
+            self.errors.append((f.remotefile, msg))
+        elif not f.failed:
+            self.sent += 1
+            self.sent_bytes += f.size
+
+    def on_status(self, path, t, msg):
+        if t is None:
+            self.errors.append((path, msg))
+
+    def close(self):
+        self.sftp.close()
+
+
+def drive(channels, timeout=TIMEOUT):
+    '''Send and handle replies for a group of SyncChannels until all their work is done'''
+    for c in channels:
+        c.pump()
+    while True:
+        busy = [c for c in channels if c.busy()]
+        if not busy:
+            break
+        ready = select.select([c.sftp.sock for c in busy], [], [], timeout)[0]
+        if not ready:
+            raise IOError('No response from host in %d seconds' % timeout)
+        for c in busy:
+            if c.sftp.sock in ready:
+                # Reads one reply, and hands it to the callback from request()
+                c.sftp._read_response()
+                c.pump()
+
+
+def sync_tree(t, localdir, remotedir, local=None, channels=CHANNELS, inflight=INFLIGHT, throttle=None):
+    '''
+    Sync localdir (whose local_inventory() can be passed in as local, to
+    share it between hosts) to remotedir over transport t, within the rate
+    limits of throttle, if given (shared by all its channels). Returns a dict
+    of counts (sent, bytes, directories, chmods, unchanged, skipped), and a
+    list of (path, error) for anything that failed.
+    '''
+    if local is None:
+        local = local_inventory(localdir)
+    start = time.time()
+    remote = remote_inventory(t, remotedir)
+    mkdirs, sends, chmods, skipped = sync_plan(local, remote or {})
+    if remote is None:
+        mkdirs.insert(0, '')
+    pool = [SyncChannel(t, inflight, throttle=throttle) for x in range(max(1, min(channels, len(sends))))]
+    try:
+        # Directories first, as files go in them
+        first = pool[0]
+        for path in mkdirs:
+            mode = local[path][3] if path else os.stat(localdir).st_mode & 0o7777
+            target = posixpath.join(remotedir, path).rstrip('/') or '/'
+            first.request(functools.partial(first.on_status, target), CMD_MKDIR, target, sync_attrs(mode))
+        for path in chmods:
+            target = posixpath.join(remotedir, path)
+            first.request(functools.partial(first.on_status, target), CMD_SETSTAT, target, sync_attrs(local[path][3]))
+        drive(pool[:1])
+        # Largest files first, each to the channel with the least queued, counting a block per file for its requests
+        load = [0] * len(pool)
+        for path in sorted(sends, key=lambda x: -local[x][1]):
+            n = load.index(min(load))
+            kind, size, mtime, mode = local[path]
+            pool[n].queue.append(SyncFile(os.path.join(localdir, *path.split('/')), posixpath.join(remotedir, path),
+                                          size, mtime, mode))
+            load[n] += size + BLOCKSIZE
+        drive(pool)
+    finally:
+        for c in pool:
+            c.close()
+    counts = {
+        'sent': sum([c.sent for c in pool]),
+        'bytes': sum([c.sent_bytes for c in pool]),
+        'directories': len(mkdirs),
+        'chmods': len(chmods),
+        'unchanged': len(local) - len([x for x in mkdirs if x]) - len(sends) - len(chmods) - len(skipped),
+        'skipped': len(skipped),
+        'seconds': time.time() - start
+    }
+    return counts, [error for c in pool for error in c.errors]
@@ -0,0 +1,737 @@
+#
+# Copyright (c) 2014, 2016, 2018, 2020 LexisNexis Risk Data Management Inc.
+#
+# This file is part of the RadSSH software package.
+#
+# RadSSH is free software, released under the Revised BSD License.
+# You are permitted to use, modify, and redsitribute this software
+# according to the Revised BSD License, a copy of which should be
+# included with the distribution as file LICENSE.txt
+#
+
+'''
+Transfer Module
+Pipelined SFTP upload engine. Rather than waiting on each write request
+in turn, up to depth write requests are kept outstanding per host, so
+throughput on high latency links is limited by bandwidth rather than
+round trips.
+
+Request depth and channel count are sized from the round trip time
+measured while opening the SFTP session (enough data in flight to cover
+the bandwidth-delay product of a link_rate link), unless set explicitly.
+The amount of unacknowledged upload data on a channel is capped by the
+window the server grants (2MB for OpenSSH), so writes are spread over
+several SFTP channels (streams) to the same file when the bandwidth-delay
+product is larger than that.
+
+The local file is read through a SharedSource, which maps it into
+memory once, so uploads of the same file to many hosts share one copy
+(the page cache) rather than each reading and copying it.
+
+Hosts that already have an older version of the file can instead be sent
+an rsync style delta (DeltaCache): blocks of the remote file are matched
+by rolling checksum, and only unmatched data is sent, to a small python
+script run on the remote host that rebuilds and verifies the file.
+
+Downloads work the same way in reverse: download() keeps up to depth SFTP
+read requests outstanding, and stream_command() writes a command's output
+(cat, tar) to a local file as it arrives. Either way, each block goes
+straight to disk, so memory use per host is bounded by the requests in
+flight (or the channel window), not the size of the file.
+
+A file can also be copied from one host to others without landing on
+local disk: a StreamSource reads it from the source host once, into a
+bounded ring of blocks that concurrent uploads (StreamReaders) send on as
+soon as each block arrives.
+'''
+
+import os
+import time
+import math
+import mmap
+import zlib
+import shlex
+import socket
+import struct
+import hashlib
+import threading
+import itertools
+import logging
+from collections import deque
+
+import paramiko
+from paramiko.sftp import CMD_WRITE, CMD_READ, CMD_DATA, CMD_STATUS, int64
+
+# Paramiko (and OpenSSH) default channel window
+MIN_WINDOW = 64 * 32768
+MAX_WINDOW = 64 * 1024 * 1024
+BLOCKSIZE = 32768
+MAX_DEPTH = 1024
+MAX_STREAMS = 8
+# Minimum file size for each extra channel, in server windows
+MIN_STREAM_WINDOWS = 8
+# Blocks of a streamed file held in memory for uploads of it
+RING_SIZE = 64 * 1024 * 1024
+MAX_STREAM_DEPTH = 64
+# Seconds without progress from the source host, or from the slowest upload
+# of a stream, before giving up on it; and how often waits check for an abort
+STALL_TIMEOUT = 60
+POLL = 0.5
+# Line rate (bytes/sec) assumed when sizing the amount of data in flight
+LINK_RATE = 125000000
+
+
+def tune(rtt, blocksize=BLOCKSIZE, link_rate=LINK_RATE, remote_window=MIN_WINDOW):
+    '''
+    (window size, request depth, streams) to keep a link_rate link busy at the
+    given round trip time, where the server grants each channel remote_window
+    '''
+    in_flight = 2 * link_rate * rtt
+    window = int(min(MAX_WINDOW, max(MIN_WINDOW, in_flight)))
+    depth = int(min(MAX_DEPTH, max(4, math.ceil(in_flight / blocksize))))
+    streams = int(min(MAX_STREAMS, max(1, math.ceil(in_flight / max(remote_window, blocksize)))))
+    return window, depth, streams
+
+
+class SharedSource(object):
+    '''
+    Local file, mapped into memory once and shared by all uploads of it.
+    read() returns memoryview slices of the mapping, so per-host uploads do
+    not each read the file, or copy its blocks into bytes objects of their own.
+    '''
+    def __init__(self, filename, blocksize=BLOCKSIZE):
+        self.filename = filename
+        self.blocksize = blocksize
+        with open(filename, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.view = memoryview(self.map)
+
+    def read(self, offset, length):
+        '''Return up to length bytes at offset, as a memoryview'''
+        return self.view[offset:offset + length]
+
+    def close(self):
+        self.view.release()
+        if self.size:
+            try:
+                self.map.close()
+            except BufferError:
+                # An uploader still holds a slice; the mapping is freed along with it
+                pass
+
+
+class Responses(dict):
+    '''SFTP responses that arrived while waiting on an earlier request, by request number'''
+    def _async_response(self, t, msg, num):
+        self[num] = (t, msg)
+
+    def wait(self, s, num):
+        '''
+        (type, message) of the response to request num on SFTP client s, which
+        may already have arrived. Raises EOFError or IOError (as paramiko does)
+        if it is an error status.
+        '''
+        if num in self:
+            kind, msg = self.pop(num)
+            if kind == CMD_STATUS:
+                s._convert_status(msg)
+            return kind, msg
+        return s._read_response(num)
+
+
+def set_attributes(s, path, attrs, existing=None):
+    '''
+    Set the permissions and (if allowed) ownership of path over SFTP client s
+    to those of attrs, skipping any that existing (the current SFTPAttributes
+    of path) already has. Returns True if anything was changed.
+    '''
+    changed = False
+    if existing is None or existing.st_mode % 4096 != attrs.st_mode % 4096:
+        s.chmod(path, attrs.st_mode % 4096)
+        changed = True
+    if existing is None or (existing.st_uid, existing.st_gid) != (attrs.st_uid, attrs.st_gid):
+        try:
+            s.chown(path, attrs.st_uid, attrs.st_gid)
+            changed = True
+        except IOError:
+            pass
+    return changed
+
+
+def upload(t, source, dstfile, attrs=None, depth=None, streams=None, blocksize=BLOCKSIZE, throttle=None):
+    '''
+    Upload a SharedSource or StreamReader (or local filename) to dstfile over transport t,
+    keeping up to depth write requests outstanding, spread over streams SFTP
+    channels, and within the rate limits of throttle (see radssh.bandwidth),
+    if given. Returns bytes sent.
+    '''
+    private_source = isinstance(source, str)
+    if private_source:
+        source = SharedSource(source, blocksize)
+    blocksize = min(blocksize, source.blocksize)
+    start = time.time()
+    clients = []
+    files = []
+    try:
+        # Opening an SFTP session takes 3 round trips (channel open, subsystem request, version exchange)
+        clients.append(paramiko.SFTPClient.from_transport(t))
+        rtt = (time.time() - start) / 3
+        # A host that stops responding fails the upload rather than hanging it
+        clients[0].get_channel().settimeout(STALL_TIMEOUT)
+        files.append(clients[0].open(dstfile, 'wb'))
+        # Data in flight on a channel is limited by the window the server grants,
+        # so cover the rest of the bandwidth-delay product with more channels
+        remote_window = clients[0].sock.out_window_size
+        window_size, tuned_depth, tuned_streams = tune(rtt, blocksize, remote_window=remote_window)
+        # Extra channels cost round trips to set up, so only worth it for larger files
+        streams = max(1, min(streams or tuned_streams, source.size // (MIN_STREAM_WINDOWS * remote_window)))
+        # No more in flight than the channels' windows can take without blocking
+        depth = depth or min(tuned_depth, streams * max(4, remote_window // blocksize))
+        for x in range(1, streams):
+            clients.append(paramiko.SFTPClient.from_transport(t, window_size=window_size))
+            clients[-1].get_channel().settimeout(STALL_TIMEOUT)
+            files.append(clients[-1].open(dstfile, 'r+b'))
+        # Replies that arrive out of order are kept until their turn, and checked then
+        responses = [Responses() for s in clients]
+        outstanding = deque()
+        offset = 0
+        block = 0
+        while offset < source.size or outstanding:
+            while offset < source.size and len(outstanding) < depth:
+                data = source.read(offset, blocksize)
+                if throttle:
+                    throttle.consume(len(data))
+                n = block % streams
+                s, f = clients[n], files[n]
+                outstanding.append((n, s._async_request(responses[n], CMD_WRITE, f.handle, int64(offset), data)))
+                offset += len(data)
+                block += 1
+            # Raises IOError if the write failed
+            n, num = outstanding.popleft()
+            responses[n].wait(clients[n], num)
+        for f in files:
+            f.close()
+        if attrs:
+            set_attributes(clients[0], dstfile, attrs)
+    finally:
+        for s in clients:
+            s.close()
+        if private_source:
+            source.close()
+    elapsed = time.time() - start
+    logging.getLogger('radssh').debug(
+        'Uploaded %d bytes to %s in %.3fs (rtt %.1fms, depth %d, streams %d)',
+        source.size, dstfile, elapsed, rtt * 1000, depth, streams)
+    return source.size
+
+
+def read_blocks(s, srcfile, depth, blocksize=BLOCKSIZE, limit=None):
+    '''
+    Read srcfile over SFTP client s, keeping up to depth read requests
+    outstanding, and yield its content in order, in blocksize pieces (the
+    last may be shorter). Reads continue past the size at open until end of
+    file, so files still being written are read in full, unless limited to
+    limit bytes.
+    '''
+    responses = Responses()
+    outstanding = deque()
+    size = s.stat(srcfile).st_size if limit is None else limit
+    f = s.open(srcfile, 'rb')
+
+    def request(offset, length):
+        return s._async_request(responses, CMD_READ, f.handle, int64(offset), int(length))
+
+    def response(num):
+        # Raises EOFError at end of file, IOError on other failures
+        kind, msg = responses.wait(s, num)
+        if kind != CMD_DATA:
+            raise paramiko.SFTPError('Expected data from read of %s' % srcfile)
+        return msg.get_string()
+
+    try:
+        offset = 0
+        eof = False
+        while outstanding or not eof:
+            # Past the expected size, one request at a time until end of file
+            while not eof and len(outstanding) < (depth if offset < size else 1):
+                length = blocksize if limit is None else min(blocksize, limit - offset)
+                if length <= 0:
+                    eof = True
+                    break
+                outstanding.append((offset, length, request(offset, length)))
+                offset += length
+            if not outstanding:
+                break
+            position, length, num = outstanding.popleft()
+            if eof:
+                # Requests made before end of file was seen
+                try:
+                    response(num)
+                except EOFError:
+                    pass
+                continue
+            data = b''
+            try:
+                data = response(num)
+                while len(data) < length:
+                    # Short read; get the rest before moving on
+                    data += response(request(position + len(data), length - len(data)))
+            except EOFError:
+                eof = True
+            if data:
+                yield data
+    finally:
+        f.close()
+
+
+def download(t, srcfile, dstfile, depth=None, blocksize=BLOCKSIZE, digest=None, throttle=None):
+    '''
+    Download srcfile over transport t into local dstfile, keeping up to depth
+    read requests outstanding (see read_blocks), and writing each block out
+    as it arrives (and to digest, a hashlib object, if given). Further reads
+    are held back to stay within the rate limits of throttle, if given.
+    Returns bytes received.
+    '''
+    start = time.time()
+    # Data in flight is capped by the requests outstanding, not the window
+    s = paramiko.SFTPClient.from_transport(t, window_size=MAX_WINDOW)
+    rtt = (time.time() - start) / 3
+    depth = depth or tune(rtt, blocksize)[1]
+    received = 0
+    try:
+        with open(dstfile, 'wb') as out:
+            for data in read_blocks(s, srcfile, depth, blocksize):
+                out.write(data)
+                if digest:
+                    digest.update(data)
+                if throttle:
+                    throttle.consume(len(data))
+                received += len(data)
+    finally:
+        s.close()
+    elapsed = time.time() - start
+    logging.getLogger('radssh').debug(
+        'Downloaded %d bytes from %s in %.3fs (rtt %.1fms, depth %d)', received, srcfile, elapsed, rtt * 1000, depth)
+    return received
+
+
+class StreamSource(object):
+    '''
+    Remote file, read once from its host over SFTP and shared, as it arrives,
+    by concurrent uploads of it (each through its own reader()), without
+    touching local disk. Blocks are held in a ring of up to capacity bytes,
+    and dropped once every reader is past them, so the slowest upload paces
+    the read from the source host.
+
+    Nothing waits indefinitely: the stream fails if abort (a threading.Event)
+    is set, if the source connection closes, or if the source host sends
+    nothing for stall_timeout seconds. An upload that holds the ring up for
+    stall_timeout seconds is dropped from the stream (its reads fail), so the
+    others can carry on.
+    '''
+    def __init__(self, size, capacity=RING_SIZE, blocksize=BLOCKSIZE, abort=None, stall_timeout=STALL_TIMEOUT):
+        self.size = size
+        self.blocksize = blocksize
+        self.capacity = max(1, capacity // blocksize)
+        # Ring of blocks, from block number base up to received
+        self.blocks = deque()
+        self.base = 0
+        self.received = 0
+        # Block number each reader is at, and reader count per block number
+        self.positions = {}
+        self.counts = {}
+        self.floor = 0
+        self.reader_ids = itertools.count()
+        self.error = None
+        self.abort = abort
+        self.stall_timeout = stall_timeout
+        self.floor_moved = time.time()
+        self.dropped = set()
+        self.cond = threading.Condition()
+
+    def aborted(self):
+        return self.abort is not None and self.abort.is_set()
+
+    def reader(self):
+        '''
+        New reader of the stream, for use as an upload() source. All readers
+        must be created before start(), and closed when done with.
+        '''
+        reader_id = next(self.reader_ids)
+        with self.cond:
+            self.positions[reader_id] = 0
+            self.counts[0] = self.counts.get(0, 0) + 1
+        return StreamReader(self, reader_id)
+
+    def start(self, t, srcfile, depth=None, throttle=None):
+        '''Start reading srcfile from transport t (within throttle's limits) into the ring, in a background thread'''
+        thread = threading.Thread(target=self.fill, args=(t, srcfile, depth, throttle), name='StreamSource-%s' % srcfile)
+        thread.daemon = True
+        thread.start()
+
+    def fill(self, t, srcfile, depth, throttle=None):
+        try:
+            start = time.time()
+            s = paramiko.SFTPClient.from_transport(t, window_size=MAX_WINDOW)
+            # Raises socket.timeout if the source host stops sending
+            s.get_channel().settimeout(self.stall_timeout)
+            try:
+                # Responses the ring has no room for queue up in the channel, and paramiko's
+                # channel buffer gets slow to read when large, so keep fewer outstanding
+                depth = depth or min(MAX_STREAM_DEPTH, tune((time.time() - start) / 3, self.blocksize)[1])
+                for data in read_blocks(s, srcfile, depth, self.blocksize, self.size):
+                    if throttle:
+                        throttle.consume(len(data))
+                    with self.cond:
+                        # Wait for the slowest reader to make room
+                        full = time.time()
+                        while self.positions and self.received - self.floor >= self.capacity:
+                            if self.aborted():
+                                raise IOError('Aborted')
+                            if not t.is_active():
+                                raise IOError('Connection to source host closed')
+                            if time.time() - max(full, self.floor_moved) > self.stall_timeout:
+                                self.drop_slowest()
+                                continue
+                            self.cond.wait(POLL)
+                        if self.aborted():
+                            raise IOError('Aborted')
+                        if not self.positions:
+                            # Every upload has finished or failed
+                            return
+                        self.blocks.append(data)
+                        self.received += 1
+                        self.cond.notify_all()
+            finally:
+                s.close()
+            if self.received * self.blocksize < self.size:
+                raise IOError('%s shrank while being read' % srcfile)
+        except Exception as e:
+            with self.cond:
+                self.error = e
+                self.cond.notify_all()
+
+    def drop_slowest(self):
+        '''Drop the readers holding up the ring (call with cond held)'''
+        floor = self.floor
+        for reader_id, index in list(self.positions.items()):
+            if index == floor:
+                logging.getLogger('radssh').warning(
+                    'Stream upload %d made no progress in %ds, dropping it', reader_id, self.stall_timeout)
+                self.dropped.add(reader_id)
+                self.move(reader_id, None)
+        self.floor_moved = time.time()
+
+    def move(self, reader_id, index):
+        '''Record reader_id at block index (None when done), dropping blocks all readers are past'''
+        old = self.positions.pop(reader_id, None)
+        if old is not None:
+            self.counts[old] -= 1
+            if not self.counts[old]:
+                del self.counts[old]
+        if index is not None:
+            self.positions[reader_id] = index
+            self.counts[index] = self.counts.get(index, 0) + 1
+        floor = self.floor
+        if not self.counts:
+            self.floor = self.received
+        else:
+            while self.floor not in self.counts:
+                self.floor += 1
+        while self.base < min(self.floor, self.received):
+            self.blocks.popleft()
+            self.base += 1
+        if self.floor != floor or not self.counts:
+            # Room for the producer
+            self.floor_moved = time.time()
+            self.cond.notify_all()
+
+    def read(self, reader_id, offset, length):
+        index = offset // self.blocksize
+        with self.cond:
+            if reader_id in self.dropped:
+                raise IOError('Upload fell behind the others, and was dropped from the stream')
+            if index != self.positions[reader_id]:
+                self.move(reader_id, index)
+            while index >= self.received and self.error is None:
+                if self.aborted():
+                    raise IOError('Aborted')
+                self.cond.wait(POLL)
+            if index >= self.received:
+                raise IOError('Read from source failed: %s' % self.error)
+            if index < self.base:
+                raise IOError('Block %d of stream no longer available' % index)
+            data = self.blocks[index - self.base]
+        start = offset - index * self.blocksize
+        return memoryview(data)[start:start + length]
+
+
+class StreamReader(object):
+    '''One upload's place in a StreamSource'''
+    def __init__(self, stream, reader_id):
+        self.stream = stream
+        self.reader_id = reader_id
+        self.size = stream.size
+        self.blocksize = stream.blocksize
+
+    def read(self, offset, length):
+        '''Return up to length bytes at offset, as a memoryview, waiting for them to arrive'''
+        return self.stream.read(self.reader_id, offset, length)
+
+    def close(self):
+        with self.stream.cond:
+            self.stream.move(self.reader_id, None)
+
+
+def stream_command(t, cmd, dstfile, blocksize=BLOCKSIZE, stderr_limit=65536, throttle=None):
+    '''
+    Run cmd over transport t, writing its stdout to local dstfile as it
+    arrives, reading no faster than throttle allows, if given. Returns
+    (return code, bytes received, last stderr_limit bytes of stderr).
+    '''
+    chan = t.open_session()
+    chan.exec_command(cmd)
+    received = 0
+    stderr = b''
+    with open(dstfile, 'wb') as out:
+        chan.settimeout(0.4)
+        while True:
+            # Keep stderr (tar -v file lists) drained, so it cannot stall the channel window
+            while chan.recv_stderr_ready():
+                stderr = (stderr + chan.recv_stderr(blocksize))[-stderr_limit:]
+            try:
+                data = chan.recv(blocksize)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            out.write(data)
+            received += len(data)
+            if throttle:
+                throttle.consume(len(data))
+    while True:
+        data = chan.recv_stderr(blocksize)
+        if not data:
+            break
+        stderr = (stderr + data)[-stderr_limit:]
+    return_code = chan.recv_exit_status()
+    chan.close()
+    return return_code, received, stderr
+
+
+# Run on the remote host (python 2 or 3) to produce the block signature of
+# the existing file ("sig"), or to rebuild it from the existing file and a
+# delta stream read from stdin ("patch"). Patched files are checked against
+# the expected SHA-256 before being moved into place.
+DELTA_SCRIPT = r"""
+import sys, os, zlib, hashlib, struct
+mode, path, bs = sys.argv[1], sys.argv[2], int(sys.argv[3])
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+inp = getattr(sys.stdin, 'buffer', sys.stdin)
+old = open(path, 'rb')
+if mode == 'sig':
+    while True:
+        b = old.read(bs)
+        if len(b) < bs:
+            break
+        out.write(struct.pack('>I', zlib.adler32(b) & 0xffffffff) + hashlib.sha1(b).digest()[:8])
+    sys.exit(0)
+digest, perm, uid, gid = sys.argv[4], int(sys.argv[5], 8), int(sys.argv[6]), int(sys.argv[7])
+def read(n):
+    d = b''
+    while len(d) < n:
+        c = inp.read(n - len(d))
+        if not c:
+            raise EOFError('Delta stream truncated')
+        d += c
+    return d
+tmp = path + '.radssh-part'
+new = open(tmp, 'wb')
+h = hashlib.sha256()
+def copy(f, n, what):
+    while n > 0:
+        d = f.read(min(n, bs))
+        if not d:
+            raise EOFError('%s truncated' % what)
+        new.write(d)
+        h.update(d)
+        n -= len(d)
+while True:
+    op = read(1)
+    if op == b'E':
+        break
+    if op == b'C':
+        start, count = struct.unpack('>QI', read(12))
+        old.seek(start * bs)
+        copy(old, count * bs, 'Existing file')
+    else:
+        copy(inp, struct.unpack('>I', read(4))[0], 'Delta stream')
+new.close()
+if h.hexdigest() != digest:
+    os.unlink(tmp)
+    sys.exit('SHA-256 mismatch after patch: %s' % h.hexdigest())
+os.chmod(tmp, perm)
+try:
+    os.chown(tmp, uid, gid)
+except OSError:
+    pass
+os.rename(tmp, path)
+out.write(h.hexdigest().encode('ascii'))
+"""
+REMOTE_PYTHON = 'P=$(command -v python3 || command -v python) && exec "$P" -c %s %s'
+ADLER_MOD = 65521
+SIGNATURE_SIZE = 12
+
+
+def delta_blocksize(size):
+    '''rsync style block size: about the square root of the file size, 4KB to 128KB'''
+    return int(min(128 * 1024, max(4096, (int(math.sqrt(size)) >> 10) << 10)))
+
+
+def remote_run(t, cmd, stdin=None, throttle=None):
+    '''
+    Run cmd on transport t, optionally feeding it stdin chunks (within
+    throttle's limits, if given); returns (return code, stdout, stderr)
+    '''
+    chan = t.open_session()
+    chan.exec_command(cmd)
+    if stdin is not None:
+        for data in stdin:
+            if throttle:
+                throttle.consume(len(data))
+            chan.sendall(data)
+        chan.shutdown_write()
+    stdout = chan.makefile('rb').read()
+    stderr = chan.makefile_stderr('rb').read()
+    return_code = chan.recv_exit_status()
+    chan.close()
+    return return_code, stdout, stderr
+
+
+def delta_command(*args):
+    return REMOTE_PYTHON % (shlex.quote(DELTA_SCRIPT), ' '.join([shlex.quote(str(x)) for x in args]))
+
+
+def remote_signature(t, path, blocksize):
+    '''[(weak, strong)] checksums of each full block of a remote file, or None if unavailable'''
+    return_code, stdout, stderr = remote_run(t, delta_command('sig', path, blocksize))
+    if return_code != 0:
+        return None
+    return [(struct.unpack('>I', stdout[x:x + 4])[0], stdout[x + 4:x + SIGNATURE_SIZE])
+            for x in range(0, len(stdout) - SIGNATURE_SIZE + 1, SIGNATURE_SIZE)]
+
+
+def compute_delta(source, signature, blocksize, max_literal=0.5, roll_limit=1024 * 1024):
+    '''
+    rsync style delta of a SharedSource against a remote block signature, as a
+    list of ('C', first block, count) copies from the remote file and ('D',
+    offset, length) literal data from source. Returns None if more than
+    max_literal of the file would be literal data anyway.
+
+    Unmatched data is searched a byte at a time (rolling Adler-32), to find
+    blocks that moved, for the first roll_limit bytes; after that, only at
+    block boundaries, so very different files cost about as much as hashing.
+    '''
+    weak = {}
+    for n, (checksum, strong) in enumerate(signature):
+        weak.setdefault(checksum, []).append(n)
+    view = source.view
+    size = source.size
+    ops = []
+    literal = 0
+    rolled = 0
+    start = 0
+    p = 0
+    checksum = zlib.adler32(view[0:blocksize]) if size >= blocksize else None
+    while p + blocksize <= size:
+        candidates = weak.get(checksum)
+        match = None
+        if candidates:
+            strong = hashlib.sha1(view[p:p + blocksize]).digest()[:8]
+            for n in candidates:
+                if signature[n][1] == strong:
+                    match = n
+                    break
+        if match is not None:
+            if start < p:
+                ops.append(('D', start, p - start))
+                literal += p - start
+            if ops and ops[-1][0] == 'C' and ops[-1][1] + ops[-1][2] == match:
+                ops[-1] = ('C', ops[-1][1], ops[-1][2] + 1)
+            else:
+                ops.append(('C', match, 1))
+            p += blocksize
+            start = p
+            checksum = zlib.adler32(view[p:p + blocksize])
+            continue
+        if literal + p - start > max_literal * size:
+            return None
+        if rolled < roll_limit and p + blocksize < size:
+            x_old = view[p]
+            a = ((checksum & 0xffff) - x_old + view[p + blocksize]) % ADLER_MOD
+            b = ((checksum >> 16) - blocksize * x_old + a - 1) % ADLER_MOD
+            checksum = (b << 16) | a
+            rolled += 1
+            p += 1
+        else:
+            p += blocksize
+            checksum = zlib.adler32(view[p:p + blocksize])
+    if start < size:
+        ops.append(('D', start, size - start))
+        literal += size - start
+    if literal > max_literal * size:
+        return None
+    return ops
+
+
+def delta_stream(source, ops, blocksize=BLOCKSIZE):
+    '''Encode delta ops for the remote patch script'''
+    for op in ops:
+        if op[0] == 'C':
+            yield b'C' + struct.pack('>QI', op[1], op[2])
+        else:
+            yield b'D' + struct.pack('>I', op[2]) + bytes(source.read(op[1], min(op[2], blocksize)))
+            for offset in range(op[1] + blocksize, op[1] + op[2], blocksize):
+                yield source.read(offset, min(blocksize, op[1] + op[2] - offset))
+    yield b'E'
+
+
+class DeltaCache(object):
+    '''
+    Deltas of a SharedSource against the remote file versions (by SHA-256)
+    found on hosts. Each delta is computed once, from the signature of the
+    first host with that version, and reused for every other host with it.
+    '''
+    def __init__(self, source, digest):
+        self.source = source
+        self.digest = digest
+        self.blocksize = delta_blocksize(source.size)
+        self.deltas = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def delta(self, t, path, remote_digest):
+        with self.lock:
+            lock = self.locks.setdefault(remote_digest, threading.Lock())
+        with lock:
+            if remote_digest not in self.deltas:
+                signature = remote_signature(t, path, self.blocksize)
+                self.deltas[remote_digest] = compute_delta(self.source, signature, self.blocksize) if signature else None
+            return self.deltas[remote_digest]
+
+    def send(self, t, path, remote_digest, attrs, throttle=None):
+        '''
+        Patch the remote file in place; returns literal bytes sent, or None if
+        a delta is not worthwhile (or not possible) for this host.
+        '''
+        ops = self.delta(t, path, remote_digest)
+        if ops is None:
+            return None
+        return_code, stdout, stderr = remote_run(t, delta_command(
+            'patch', path, self.blocksize, self.digest, '%o' % (attrs.st_mode % 4096), attrs.st_uid, attrs.st_gid),
+            delta_stream(self.source, ops), throttle)
+        if return_code != 0 or stdout.decode('ascii', 'replace') != self.digest:
+            raise IOError('Delta transfer to %s failed [%s]: %s' % (path, return_code, stderr.decode('UTF-8', 'replace').strip()))
+        return sum([op[2] for op in ops if op[0] == 'D'])
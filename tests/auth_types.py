@@ -0,0 +1,64 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import paramiko
+
+from radssh.authmgr import AuthManager
+from tests.sshserver import connect
+
+# Remembered server auth types (auth_hints), with two hosts that run the
+# same server version but accept different auth types: a key only host,
+# and one that also takes passwords but not this user's key. Types learned
+# from one host must not rule out methods on the other (the version string
+# only saves the auth_none probe), and a host's own stale types must not
+# stop it authenticating (or lose the server banner on the way). An empty
+# preference list fails cleanly, still scoring a saved auth hint a miss.
+# python -m tests.auth_types
+root = tempfile.mkdtemp()
+key = paramiko.RSAKey.generate(2048)
+other_key = paramiko.RSAKey.generate(2048)
+hosts = {
+    'keyonly': {'publickey': key},
+    'mixed': {'publickey': other_key, 'password': 'secret'},
+}
+sshconfig = {'identityfile': [], 'batchmode': 'yes'}
+
+
+def authenticate(host, seed=None, try_auth_none=False, config=sshconfig):
+    '''Fresh AuthManager (key and password), with allowed types seeded as if from an earlier session'''
+    auth = AuthManager('user', auth_file=os.path.join(root, 'none'), default_password='secret',
+                       try_auth_none=try_auth_none, hints_file=os.path.join(root, 'hints'))
+    auth.agent_connection = None
+    auth.add_key(key)
+    t = connect(0.0, auths=hosts[host])
+    t.name = host
+    for name, types in (seed or {}).items():
+        auth.hints.allowed[t.remote_version if name == 'version' else name] = types
+    ok = auth.authenticate(t, config)
+    sys.stderr.write('%-8s seeded %-50r %s\n' % (host, seed, 'authenticated' if ok and t.is_authenticated() else 'FAILED'))
+    if config is sshconfig:
+        assert ok and t.is_authenticated(), host
+        assert t.get_banner() == b'Authorized use only\n', (host, t.get_banner())
+    else:
+        assert not ok and not t.is_authenticated(), host
+        assert t.auth_hint == 'miss', t.auth_hint
+    t.close()
+    return auth
+
+
+# Both hosts run the same (paramiko) server version, so each borrows what the other's version string has learned
+authenticate('mixed', {'version': ['publickey']})
+authenticate('keyonly', {'version': ['password']})
+# A host's own saved types that have gone stale
+authenticate('mixed', {'mixed': ['publickey']})
+authenticate('keyonly', {'keyonly': ['password']})
+# Learned for real with the auth_none probe, then reused by the other host
+auth = authenticate('keyonly', try_auth_none=True)
+assert auth.hints.allowed_types('keyonly') == ['publickey']
+auth.save_hints()
+authenticate('mixed', try_auth_none=True)
+# Nothing left to try, with a saved hint for the host
+authenticate('keyonly', config=dict(sshconfig, preferredauthentications=[]))
+shutil.rmtree(root)
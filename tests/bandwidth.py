@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+from radssh.bandwidth import Bandwidth
+from radssh.transfer import upload, download
+from tests.sshserver import connect
+
+# Bandwidth limits over an emulated link (see tests.sshserver): uploads
+# and downloads with a per-host and a total limit, checking that one host
+# alone runs at its own limit, and that several at once share the total,
+# with the share of a host that finishes early going to the others.
+# python -m tests.bandwidth [total MB/s] [per host MB/s]
+total = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+per_host = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+root = tempfile.mkdtemp()
+sizes = [8 << 20, 8 << 20, 2 << 20]
+for n, size in enumerate(sizes):
+    with open(os.path.join(root, 'src%d' % n), 'wb') as f:
+        f.write(os.urandom(size))
+bandwidth = Bandwidth({'bandwidth.total': total, 'bandwidth.host': per_host})
+transports = [connect(0.005) for size in sizes]
+
+
+def check(label, elapsed, size, rate):
+    sys.stderr.write('%-28s %d bytes in %.2fs (%.2f MB/s, limit %g MB/s)\n' % (
+        label, size, elapsed, size / 1e6 / elapsed, rate))
+    # Allow for the initial burst, and set up time
+    assert 0.8 * rate < size / 1e6 / elapsed < 1.1 * rate, label
+
+
+start = time.time()
+upload(transports[0], os.path.join(root, 'src0'), os.path.join(root, 'dst0'), throttle=bandwidth.host('h0'))
+check('upload (one host)', time.time() - start, sizes[0], per_host)
+
+start = time.time()
+download(transports[0], os.path.join(root, 'src1'), os.path.join(root, 'dl1'), throttle=bandwidth.host('h0'))
+check('download (one host)', time.time() - start, sizes[1], per_host)
+
+# Hosts start at the total share each, and go up to the per-host limit once the small one finishes
+elapsed = {}
+
+
+def send(n):
+    start = time.time()
+    upload(transports[n], os.path.join(root, 'src%d' % n), os.path.join(root, 'dst%d' % n), throttle=bandwidth.host('h%d' % n))
+    elapsed[n] = time.time() - start
+
+
+start = time.time()
+threads = [threading.Thread(target=send, args=(n,)) for n in range(len(sizes))]
+for thr in threads:
+    thr.start()
+for thr in threads:
+    thr.join()
+check('upload (%d hosts, total)' % len(sizes), time.time() - start, sum(sizes), total)
+for n, size in enumerate(sizes):
+    sys.stderr.write('%-28s %.2f MB/s\n' % ('  h%d' % n, size / 1e6 / elapsed[n]))
+    assert size / 1e6 / elapsed[n] < 1.1 * per_host
+    with open(os.path.join(root, 'src%d' % n), 'rb') as a, open(os.path.join(root, 'dst%d' % n), 'rb') as b:
+        assert a.read() == b.read()
+
+for t in transports:
+    t.close()
+shutil.rmtree(root)
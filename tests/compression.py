@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import zlib
+import random
+import shutil
+import tempfile
+
+from radssh.ssh import exec_command, Quota
+from tests.sshserver import connect
+
+# CPU vs bandwidth trade-off of SSH compression (the compression setting,
+# or Compression in ssh_config) for command output over an emulated slow
+# link (see tests.sshserver): compressible text (log and package list
+# style lines) and incompressible (random) data, each read with
+# exec_command with and without compression. CPU time is for the whole
+# process, so covers both ends of the connection. Compression pays off
+# where the link, rather than zlib (a few MB/s, per connection), is the
+# limit.
+# python -m tests.compression [link MB/s] [rtt seconds]
+rate = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+rtt = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+root = tempfile.mkdtemp()
+rng = random.Random(1)
+words = ['kernel', 'systemd', 'sshd', 'audit', 'eth0', 'link', 'up', 'session', 'opened', 'closed', 'for', 'user', 'root']
+with open(os.path.join(root, 'text'), 'w') as f:
+    for n in range(120000):
+        f.write('Oct 19 12:%02d:%02d host%03d %s[%d]: %s\n' % (
+            n // 60 % 60, n % 60, rng.randint(0, 200), rng.choice(words), rng.randint(1, 30000),
+            ' '.join([rng.choice(words) for x in range(rng.randint(3, 10))])))
+        if n % 3 == 0:
+            f.write('%s-%d.%d.%d-%d.el8.x86_64\n' % (rng.choice(words), rng.randint(0, 9), rng.randint(0, 20),
+                                                     rng.randint(0, 99), rng.randint(1, 9)))
+with open(os.path.join(root, 'random'), 'wb') as f:
+    f.write(os.urandom(2 << 20))
+
+for name in ('text', 'random'):
+    with open(os.path.join(root, name), 'rb') as f:
+        data = f.read()
+    sys.stderr.write('%s: %d bytes, %.1f%% of that with zlib\n' % (name, len(data), 100.0 * len(zlib.compress(data, 6)) / len(data)))
+    for compress in (False, True):
+        t = connect(rtt, rate=rate * 1e6, compress=compress)
+        start = time.time()
+        cpu = time.process_time()
+        res = exec_command('host', t, 'cat %s' % os.path.join(root, name), Quota(), None)
+        elapsed = time.time() - start
+        cpu = time.process_time() - cpu
+        # Output has its final newline stripped
+        assert res.stdout == (data[:-1] if data.endswith(b'\n') else data)
+        assert t.local_compression == ('zlib@openssh.com' if compress else 'none'), t.local_compression
+        sys.stderr.write('  %-16s %.2fs (%.2f MB/s), %.2fs CPU\n' % (
+            'compressed' if compress else 'uncompressed', elapsed, len(data) / 1e6 / elapsed, cpu))
+        t.close()
+shutil.rmtree(root)
@@ -0,0 +1,28 @@
+import sys
+import time
+import queue
+
+from radssh.console import RadSSHConsole, colorizer, monochrome
+
+# Simulated fleet output: many hosts each sending small multi-line chunks,
+# as the exec threads would after each recv(). Run with stdout redirected
+# (python -m tests.console_throughput > /dev/null) to measure the renderer
+# rather than the terminal emulator.
+host_count = 500
+chunks_per_host = 40
+lines_per_chunk = 5
+
+hosts = ['host%04d.example.com' % x for x in range(host_count)]
+chunk = '\n'.join(['line %d of some typical command output text' % x for x in range(lines_per_chunk)])
+
+for formatter in (colorizer, monochrome):
+    console = RadSSHConsole(q=queue.Queue(300), formatter=formatter)
+    start = time.time()
+    for n in range(chunks_per_host):
+        for host in hosts:
+            console.q.put(((host, n % 10 == 0), chunk))
+    console.join()
+    elapsed = time.time() - start
+    total_lines = host_count * chunks_per_host * lines_per_chunk
+    sys.stderr.write('%-10s %d lines in %.3fs: %.0f lines/s\n' %
+                     (formatter.__name__, total_lines, elapsed, total_lines / elapsed))
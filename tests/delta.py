@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import paramiko
+
+from radssh.ssh import sftp_thread, file_sha256, remote_sha256
+from radssh.transfer import SharedSource, DeltaCache
+from tests.sshserver import connect
+
+# Delta transfers (sftp.delta) over an emulated high latency link (see
+# tests.sshserver, whose hosts run the remote patch script with the local
+# python): the remote copy is an older version of the file, with data
+# inserted, replaced, and cut, and only the changes should be sent. The
+# patched copy must match the new file, with its permissions. Then checks
+# that a host whose copy is already identical (sftp.skip_identical) still
+# gets its permissions fixed.
+# python -m tests.delta [rtt seconds] [file size MB]
+rtt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+root = tempfile.mkdtemp()
+mb = 1 << 20
+
+old = os.urandom(size * mb)
+new = old[:mb] + b'inserted' + old[mb:3 * mb] + os.urandom(5000) + old[3 * mb + 5000:5 * mb] + old[5 * mb + 70000:]
+srcfile = os.path.join(root, 'new')
+with open(srcfile, 'wb') as f:
+    f.write(new)
+os.chmod(srcfile, 0o640)
+attrs = paramiko.SFTPAttributes.from_stat(os.stat(srcfile))
+source = SharedSource(srcfile)
+digest = file_sha256(srcfile)
+deltas = DeltaCache(source, digest)
+
+t = connect(rtt, root)
+for host in ('host1', 'host2'):
+    target = os.path.join(root, host)
+    with open(target, 'wb') as f:
+        f.write(old)
+    os.chmod(target, 0o600)
+    start = time.time()
+    # The second host has the same old version, so reuses the delta
+    summary = sftp_thread(host, t, srcfile, host, attrs, digest, source,
+                          remote_digest=remote_sha256(t, host), deltas=deltas)
+    assert summary.verified and summary.stdout.endswith('(delta)'), summary.stdout
+    with open(target, 'rb') as f:
+        assert f.read() == new, host
+    assert os.stat(target).st_mode & 0o7777 == 0o640
+    sent = int(summary.stdout.split()[1])
+    assert sent < len(new) // 50, summary.stdout
+    sys.stderr.write('%-10s %s in %.2fs\n' % (host, summary.stdout, time.time() - start))
+
+# Identical content, wrong permissions
+os.chmod(os.path.join(root, 'host1'), 0o600)
+summary = sftp_thread('host1', t, srcfile, 'host1', attrs, digest, source,
+                      remote_digest=remote_sha256(t, 'host1'), deltas=deltas)
+assert summary.stdout == 'Already up to date (attributes updated)', summary.stdout
+assert os.stat(os.path.join(root, 'host1')).st_mode & 0o7777 == 0o640
+summary = sftp_thread('host1', t, srcfile, 'host1', attrs, digest, source,
+                      remote_digest=remote_sha256(t, 'host1'), deltas=deltas)
+assert summary.stdout == 'Already up to date', summary.stdout
+
+source.close()
+t.close()
+shutil.rmtree(root)
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+from radssh.filestore import FileStore, collect
+from tests.sshserver import connect
+
+# Collection of the same files from many hosts into a content addressed
+# store, over emulated high latency links (see tests.sshserver; each
+# "host" is a directory of its own). Half the hosts share the same content,
+# the rest differ in one file. Hosts are collected from in parallel, as by
+# Cluster.collect. Checks that identical content is stored and fetched
+# once, that per-host copies are hard links into the store, that a
+# second collection fetches nothing, and that a change on one host fetches
+# just that file.
+# python -m tests.filestore [rtt seconds] [host count]
+rtt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+root = tempfile.mkdtemp()
+paths = ['etc/config', 'var/log/big.log', 'etc/hostname']
+common = dict([(path, os.urandom(2 << 20 if 'big' in path else 500)) for path in paths])
+
+
+def populate(host):
+    for path in paths:
+        data = common[path]
+        if path == 'etc/hostname' and host % 2:
+            data = b'host%d\n' % host
+        target = os.path.join(root, 'hosts', str(host), path)
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        with open(target, 'wb') as f:
+            f.write(data)
+
+
+def run(label, transports, store):
+    start = time.time()
+    results = {}
+
+    def collect_host(host, t):
+        dstfiles = [os.path.join(root, 'out', str(host), path) for path in paths]
+        results[host] = (dstfiles, collect(t, host, paths, dstfiles, store))
+    threads = [threading.Thread(target=collect_host, args=item) for item in transports.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    fetched = 0
+    hows = {}
+    for host, (dstfiles, (received, outcome)) in results.items():
+        fetched += received
+        for path, dstfile in zip(paths, dstfiles):
+            assert not isinstance(outcome[path], Exception), outcome[path]
+            hows[outcome[path]] = hows.get(outcome[path], 0) + 1
+            with open(dstfile, 'rb') as a, open(os.path.join(root, 'hosts', str(host), path), 'rb') as b:
+                assert a.read() == b.read(), dstfile
+    store.save()
+    sys.stderr.write('%-20s %d hosts at %dms RTT in %.2fs: %d bytes fetched %r\n' % (
+        label, len(transports), rtt * 1000, time.time() - start, fetched, hows))
+    return fetched, hows
+
+
+for host in range(count):
+    populate(host)
+transports = dict([(host, connect(rtt, os.path.join(root, 'hosts', str(host)))) for host in range(count)])
+store = FileStore(os.path.join(root, 'store'))
+fetched, hows = run('first collection', transports, store)
+# Common content of each path, plus the hostname of each odd numbered host
+distinct = len(paths) + count // 2
+objects = sum([len(files) for dirpath, dirnames, files in os.walk(os.path.join(store.path, 'objects'))])
+assert objects == distinct, (objects, distinct)
+# Each distinct content fetched from one host only, however the hosts raced
+assert hows.get('fetched') == distinct, hows
+assert fetched == sum([len(data) for data in common.values()]) + sum([len(b'host%d\n' % host) for host in range(1, count, 2)])
+big = [os.stat(os.path.join(root, 'out', str(host), 'var/log/big.log')) for host in range(count)]
+assert len(set([st.st_ino for st in big])) == 1
+
+# A fresh FileStore, so the index is read back from disk
+fetched, hows = run('second collection', transports, FileStore(os.path.join(root, 'store')))
+assert fetched == 0 and hows == {'unchanged': count * len(paths)}
+
+with open(os.path.join(root, 'hosts', '0', 'etc/config'), 'ab') as f:
+    f.write(b'changed')
+fetched, hows = run('one change', transports, FileStore(os.path.join(root, 'store')))
+assert hows.get('fetched') == 1 and hows.get('unchanged') == count * len(paths) - 1
+
+for t in transports.values():
+    t.close()
+shutil.rmtree(root)
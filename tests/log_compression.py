@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from radssh.logwriter import LogWriter
+from radssh.logfile import CompressedLog, read_log, open_log, zstandard, SUFFIX
+from radssh.ssh import CommandResult
+from radssh.dispatcher import JobSummary
+
+# Simulated session: typical command output (package lists, ps, logs) from
+# many hosts, logged through the background LogWriter. Reports write
+# throughput and on-disk size for each compression setting, and checks that
+# the logs read back identically to the uncompressed ones. Then reads back
+# a log of many small members (one per command), with one still being
+# written at the end, through open_log().
+host_count = 500
+command_count = 10
+lines_per_host = 200
+
+hosts = ['host%04d.example.com' % x for x in range(host_count)]
+
+
+def output(host, n):
+    return b'\n'.join([('%s pkg-%d-%d.x86_64 %d.%d.%d-%d.el7 installed (cmd %d)' % (
+        host, x, x % 17, x % 3, x % 11, x % 7, x % 5, n)).encode() for x in range(lines_per_host)])
+
+
+results = {}
+for compression in ['off', 'gzip'] + (['zstd'] if zstandard else []):
+    logdir = tempfile.mkdtemp()
+    writer = LogWriter(logdir, compression=compression)
+    volume = 0
+    start = time.time()
+    for n in range(command_count):
+        for host in hosts:
+            stdout = output(host, n)
+            volume += len(stdout)
+            writer.submit(host, JobSummary(True, 0, CommandResult(
+                command='rpm -qa # %d' % n, status='*** Complete ***', return_code=0, stdout=stdout, stderr=b'')))
+        writer.barrier()
+        if n == 0:
+            # Readable mid-session
+            assert read_log(os.path.join(logdir, 'out.log')).count(b'\n') == host_count * (lines_per_host + 1)
+    writer.close()
+    elapsed = time.time() - start
+    size = sum([os.path.getsize(os.path.join(logdir, x)) for x in os.listdir(logdir)])
+    results[compression] = read_log(os.path.join(logdir, 'out.log')), read_log(os.path.join(logdir, hosts[7] + '.log'))
+    assert os.path.exists(os.path.join(logdir, 'out.log' + SUFFIX.get(compression, '')))
+    sys.stderr.write('%-5s %6.1f MB logged in %.2fs: %6.1f MB/s, %7.1f MB on disk (%.1f%%)\n' % (
+        compression, volume / 1e6, elapsed, volume / 1e6 / elapsed, size / 1e6, 100.0 * size / volume))
+    shutil.rmtree(logdir)
+
+for compression, logs in results.items():
+    assert logs == results['off'], compression
+
+# A member per command: reading back must stay linear in the member count
+logdir = tempfile.mkdtemp()
+for compression in ['gzip'] + (['zstd'] if zstandard else []):
+    filename = os.path.join(logdir, 'many.log' + SUFFIX[compression])
+    log = CompressedLog(filename, compression)
+    for n in range(5000):
+        log.write(b'%d %s\n' % (n, os.urandom(2000).hex().encode()))
+        log.flush()
+    # Incomplete member, as if still being written
+    complete = log.f.tell()
+    log.write(os.urandom(100000))
+    log.f.flush()
+    assert os.path.getsize(filename) > complete
+    start = time.time()
+    with open_log(os.path.join(logdir, 'many.log')) as f:
+        lines = [line.split()[0] for line in f]
+    assert lines == [str(n) for n in range(5000)], compression
+    sys.stderr.write('%-5s %d members read back in %.2fs\n' % (compression, len(lines), time.time() - start))
+    os.unlink(filename)
+shutil.rmtree(logdir)
@@ -0,0 +1,57 @@
+import time
+import random
+
+from radssh.ssh import OrderedRelease
+
+# Compare ordered output bookkeeping for a large cluster with hosts
+# completing in random order: the former list based approach (pop(0)
+# and remove() per completion) against OrderedRelease, with and without
+# a window. Also shows how long the first output is held up when the
+# first listed host is the slowest.
+host_count = 10000
+hosts = ['host%05d' % x for x in range(host_count)]
+completion_order = hosts[:]
+random.seed(42)
+random.shuffle(completion_order)
+# Worst case for head-of-line blocking: first host finishes last
+completion_order.remove(hosts[0])
+completion_order.append(hosts[0])
+
+
+def list_based():
+    ordered_list = list(hosts)
+    result = {}
+    released = []
+    for n, host in enumerate(completion_order):
+        result[host] = n
+        while ordered_list and ordered_list[0] in result:
+            released.append((n, ordered_list.pop(0)))
+    return released
+
+
+def deque_based(window):
+    ordered = OrderedRelease(window)
+    for host in hosts:
+        ordered.add(host)
+    released = []
+    for n, host in enumerate(completion_order):
+        released.extend([(n, h) for h, job in ordered.complete(host, n)])
+    return released
+
+
+for label, fn in [('list', list_based),
+                  ('deque (strict)', lambda: deque_based(0)),
+                  ('deque (window 100)', lambda: deque_based(100))]:
+    start = time.time()
+    released = fn()
+    elapsed = time.time() - start
+    assert len(released) == host_count
+    print('%-20s %d hosts in %.3fs, first output after %d completions' %
+          (label, len(released), elapsed, released[0][0] + 1))
+
+# The list based approach also did a remove() per completion in stream mode
+ordered_list = list(hosts)
+start = time.time()
+for host in completion_order:
+    ordered_list.remove(host)
+print('%-20s %d hosts in %.3fs (formerly paid in every output mode)' % ('list remove()', host_count, time.time() - start))
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import socket
+import hashlib
+import tempfile
+import threading
+import queue
+
+import paramiko
+
+from radssh.transfer import upload, download, SharedSource, StreamSource
+
+# Upload throughput over an emulated high latency link: an in-process
+# paramiko SFTP server, reached through a socket relay that delays all
+# traffic by rtt/2 in each direction. Compares paramiko SFTPClient.put
+# with the pipelined upload engine (and SFTPClient.get with download), then
+# copies the file from one host to several others via a local file, and
+# streamed through a StreamSource, and checks the transferred content.
+# Then checks that a stalled upload is dropped from a stream (so the rest
+# finish), and that an abort fails a stream promptly.
+# python -m tests.sftp_upload [rtt seconds] [file size MB]
+rtt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+size = int(sys.argv[2]) << 20 if len(sys.argv) > 2 else 16 << 20
+root = tempfile.mkdtemp()
+
+
+class Server(paramiko.ServerInterface):
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'none'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class Handle(paramiko.SFTPHandle):
+    pass
+
+
+class SFTPServer(paramiko.SFTPServerInterface):
+    def open(self, path, flags, attr):
+        handle = Handle(flags)
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            fd = os.open(os.path.join(root, os.path.basename(path)), flags | os.O_CREAT, 0o644)
+            handle.writefile = os.fdopen(fd, 'wb')
+        else:
+            handle.readfile = open(os.path.join(root, os.path.basename(path)), 'rb')
+        handle.filename = path
+        return handle
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(root, os.path.basename(path))))
+
+    def chmod(self, path, mode):
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+def delay_pipe(src, dst, delay):
+    '''Forward data from src to dst, delayed by delay seconds'''
+    q = queue.Queue()
+
+    def reader():
+        while True:
+            data = src.recv(65536)
+            q.put((time.time() + delay, data))
+            if not data:
+                break
+
+    def writer():
+        while True:
+            when, data = q.get()
+            pause = when - time.time()
+            if pause > 0:
+                time.sleep(pause)
+            if not data:
+                dst.shutdown(socket.SHUT_WR)
+                break
+            dst.sendall(data)
+    for target in (reader, writer):
+        threading.Thread(target=target, daemon=True).start()
+
+
+def connect():
+    client_sock, client_relay = socket.socketpair()
+    server_sock, server_relay = socket.socketpair()
+    delay_pipe(client_relay, server_relay, rtt / 2)
+    delay_pipe(server_relay, client_relay, rtt / 2)
+    server = paramiko.Transport(server_sock)
+    server.add_server_key(paramiko.RSAKey.generate(2048))
+    server.set_subsystem_handler('sftp', paramiko.SFTPServer, SFTPServer)
+    server.start_server(event=threading.Event(), server=Server())
+    t = paramiko.Transport(client_sock)
+    t.connect()
+    t.auth_none('user')
+    return t
+
+
+srcfile = os.path.join(root, 'source')
+with open(srcfile, 'wb') as f:
+    f.write(os.urandom(size))
+with open(srcfile, 'rb') as f:
+    expected = hashlib.sha256(f.read()).hexdigest()
+
+t = connect()
+for name in ('SFTPClient.put', 'upload'):
+    dst = 'copy-%s' % name
+    start = time.time()
+    if name == 'upload':
+        upload(t, SharedSource(srcfile), dst)
+    else:
+        s = t.open_sftp_client()
+        s.put(srcfile, dst)
+        s.close()
+    elapsed = time.time() - start
+    with open(os.path.join(root, dst), 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == expected, name
+    sys.stderr.write('%-15s %d MB at %dms RTT in %.2fs: %.1f MB/s\n' % (name, size >> 20, rtt * 1000, elapsed, size / 1e6 / elapsed))
+for name in ('SFTPClient.get', 'download'):
+    dst = os.path.join(root, 'fetched-%s' % name)
+    start = time.time()
+    if name == 'download':
+        download(t, 'copy-upload', dst)
+    else:
+        s = t.open_sftp_client()
+        s.get('copy-upload', dst)
+        s.close()
+    elapsed = time.time() - start
+    with open(dst, 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == expected, name
+    sys.stderr.write('%-15s %d MB at %dms RTT in %.2fs: %.1f MB/s\n' % (name, size >> 20, rtt * 1000, elapsed, size / 1e6 / elapsed))
+
+targets = [connect() for x in range(4)]
+for name in ('download+upload', 'StreamSource'):
+    start = time.time()
+    cpu = time.process_time()
+    threads = []
+    if name == 'StreamSource':
+        stream = StreamSource(size, 16 << 20)
+        sources = [stream.reader() for x in targets]
+        stream.start(t, 'copy-upload')
+    else:
+        download(t, 'copy-upload', os.path.join(root, 'spool'))
+        sources = [SharedSource(os.path.join(root, 'spool')) for x in targets]
+    for n, target in enumerate(targets):
+        threads.append(threading.Thread(target=upload, args=(target, sources[n], 'copy-%s-%d' % (name, n))))
+        threads[-1].start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    for n in range(len(targets)):
+        sources[n].close()
+        with open(os.path.join(root, 'copy-%s-%d' % (name, n)), 'rb') as f:
+            assert hashlib.sha256(f.read()).hexdigest() == expected, name
+    sys.stderr.write('%-15s %d MB to %d hosts at %dms RTT in %.2fs (%.2fs CPU)\n' % (
+        name, size >> 20, len(targets), rtt * 1000, elapsed, time.process_time() - cpu))
+
+
+def stream_uploads(stream, count):
+    '''Upload stream to count targets at once; returns [exception or None] per upload'''
+    outcome = [None] * count
+    readers = [stream.reader() for n in range(count)]
+
+    def run(n):
+        try:
+            upload(targets[n], readers[n], 'copy-stream-%d' % n)
+        except IOError as e:
+            outcome[n] = e
+        finally:
+            readers[n].close()
+    stream.start(t, 'copy-upload')
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcome
+
+
+# A reader that never reads holds the ring up until it is dropped
+stream = StreamSource(size, 1 << 20, stall_timeout=1)
+stalled = stream.reader()
+start = time.time()
+assert stream_uploads(stream, 2) == [None, None]
+for n in range(2):
+    with open(os.path.join(root, 'copy-stream-%d' % n), 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == expected
+try:
+    stalled.read(0, 10)
+    raise AssertionError('stalled reader was not dropped')
+except IOError as e:
+    sys.stderr.write('%-15s dropped stalled upload, others done in %.2fs (%s)\n' % ('StreamSource', time.time() - start, e))
+
+# With a stalled reader and no stall timeout in reach, only the abort can end it
+abort = threading.Event()
+stream = StreamSource(size, 1 << 20, abort=abort)
+stalled = stream.reader()
+threading.Timer(1, abort.set).start()
+start = time.time()
+outcome = stream_uploads(stream, 2)
+assert all([isinstance(e, IOError) for e in outcome]), outcome
+assert time.time() - start < 5
+sys.stderr.write('%-15s aborted in %.2fs: %s\n' % ('StreamSource', time.time() - start, outcome[0]))
+t.close()
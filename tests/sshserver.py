@@ -0,0 +1,168 @@
+import os
+import time
+import queue
+import socket
+import threading
+import subprocess
+
+import paramiko
+
+# In-process SSH server for the transfer tests: SFTP on the local
+# filesystem (remote paths are local paths, relative ones to the cwd given
+# to connect(), which can stand in for a host of its own), and exec of
+# commands with the local shell (channel input as their stdin), reached
+# through a socket relay that delays all traffic by rtt/2 in each direction
+# to emulate a high latency link (and, if given a rate, paces it to that
+# many bytes/sec, as a slow one).
+
+
+class Server(paramiko.ServerInterface):
+    def __init__(self, cwd=None, auths=None):
+        self.cwd = cwd or os.getcwd()
+        # {method: password or key} to require instead of auth none
+        self.auths = auths
+        self.banner = 'Authorized use only\n' if auths else None
+
+    def check_auth_none(self, username):
+        return paramiko.AUTH_FAILED if self.auths else paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == self.auths.get('password') else paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL if key == self.auths.get('publickey') else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return ','.join(self.auths) if self.auths else 'none'
+
+    def get_banner(self):
+        # Sent once per connection, as OpenSSH does (paramiko would repeat it per auth attempt)
+        banner, self.banner = self.banner, None
+        return banner, 'en-US'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def feed(p):
+            # Channel input to the command, until the client shuts down writing
+            try:
+                for data in iter(lambda: channel.recv(65536), b''):
+                    p.stdin.write(data)
+                p.stdin.close()
+            except (OSError, ValueError):
+                pass
+
+        def run():
+            p = subprocess.Popen(command.decode(), shell=True, cwd=self.cwd, stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            threading.Thread(target=feed, args=(p,), daemon=True).start()
+            stderr = []
+            reader = threading.Thread(target=lambda: stderr.append(p.stderr.read()), daemon=True)
+            reader.start()
+            stdout = p.stdout.read()
+            reader.join()
+            p.wait()
+            channel.sendall(stdout)
+            channel.sendall_stderr(stderr[0])
+            channel.send_exit_status(p.returncode)
+            channel.close()
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+class Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class SFTPServer(paramiko.SFTPServerInterface):
+    def __init__(self, server, *args, **kwargs):
+        paramiko.SFTPServerInterface.__init__(self, server, *args, **kwargs)
+        self.cwd = server.cwd
+
+    def canonicalize(self, path):
+        return os.path.join(self.cwd, path)
+
+    def open(self, path, flags, attr):
+        path = self.canonicalize(path)
+        fd = os.open(path, flags, attr.st_mode or 0o644)
+        handle = Handle(flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, 'r+b' if flags & (os.O_WRONLY | os.O_RDWR) else 'rb')
+        return handle
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(self.canonicalize(path)))
+
+    lstat = stat
+
+    def list_folder(self, path):
+        path = self.canonicalize(path)
+        return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, x)), x) for x in os.listdir(path)]
+
+    def mkdir(self, path, attr):
+        os.mkdir(self.canonicalize(path), attr.st_mode or 0o755)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        paramiko.SFTPServer.set_file_attr(self.canonicalize(path), attr)
+        return paramiko.SFTP_OK
+
+
+def delay_pipe(src, dst, delay, rate=None):
+    '''Forward data from src to dst, delayed by delay seconds, and no faster than rate'''
+    q = queue.Queue()
+
+    def reader():
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                # Reset as the other end closes; same as end of stream
+                data = b''
+            q.put((time.time() + delay, data))
+            if not data:
+                break
+
+    def writer():
+        free = 0
+        while True:
+            when, data = q.get()
+            if rate:
+                # Data queues behind what is still being sent
+                when = free = max(when, free) + len(data) / float(rate)
+            pause = when - time.time()
+            if pause > 0:
+                time.sleep(pause)
+            try:
+                if not data:
+                    dst.shutdown(socket.SHUT_WR)
+                    break
+                dst.sendall(data)
+            except OSError:
+                # Other end already closed
+                break
+    for target in (reader, writer):
+        threading.Thread(target=target, daemon=True).start()
+
+
+def connect(rtt, cwd=None, rate=None, compress=False, auths=None):
+    '''
+    Transport to a new server, authenticated with auth none, or if auths
+    (see Server) is given, connected but left to authenticate.
+    '''
+    client_sock, client_relay = socket.socketpair()
+    server_sock, server_relay = socket.socketpair()
+    delay_pipe(client_relay, server_relay, rtt / 2, rate)
+    delay_pipe(server_relay, client_relay, rtt / 2, rate)
+    server = paramiko.Transport(server_sock)
+    server.use_compression(compress)
+    server.add_server_key(paramiko.RSAKey.generate(2048))
+    server.set_subsystem_handler('sftp', paramiko.SFTPServer, SFTPServer)
+    server.start_server(event=threading.Event(), server=Server(cwd, auths))
+    t = paramiko.Transport(client_sock)
+    t.use_compression(compress)
+    t.connect()
+    if not auths:
+        t.auth_none('user')
+    return t
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from radssh.sync import sync_tree, local_inventory
+from tests.sshserver import connect
+
+# Directory tree sync over an emulated high latency link: an in-process
+# paramiko server (SFTP on the local filesystem, and exec of commands for
+# the remote inventory), reached through a socket relay that delays all
+# traffic by rtt/2 in each direction. Compares a put, chmod, and utime per
+# file with sync_tree, then checks that a second sync sends nothing, that
+# a change to one file sends just that file, and that a file which shrank
+# after the (shared) inventory was taken is sent as it is now.
+# python -m tests.sync [rtt seconds] [file count]
+rtt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+root = tempfile.mkdtemp()
+
+
+def compare(localdir, remotedir):
+    local = local_inventory(localdir)
+    remote = local_inventory(remotedir)
+    assert sorted(local) == sorted(remote)
+    for path, (kind, size, mtime, mode) in local.items():
+        assert remote[path][0] == kind and remote[path][3] == mode, path
+        if kind == 'f':
+            assert remote[path][1:3] == (size, mtime), path
+            with open(os.path.join(localdir, path), 'rb') as a, open(os.path.join(remotedir, path), 'rb') as b:
+                assert a.read() == b.read(), path
+
+
+# Source tree: small files in nested directories, a few larger ones
+localdir = os.path.join(root, 'local')
+for n in range(count):
+    path = os.path.join(localdir, 'd%d' % (n % 10), 'e%d' % (n % 3), 'file%d' % n)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(os.urandom(300 + n * 7 if n % 100 else 3 << 20))
+    os.chmod(path, 0o600 if n % 2 else 0o644)
+    os.utime(path, (1500000000 + n, 1500000000 + n))
+
+t = connect(rtt)
+start = time.time()
+s = t.open_sftp_client()
+naive = os.path.join(root, 'naive')
+for dirpath, dirnames, filenames in os.walk(localdir):
+    target = os.path.normpath(os.path.join(naive, os.path.relpath(dirpath, localdir)))
+    s.mkdir(target)
+    for name in filenames:
+        st = os.stat(os.path.join(dirpath, name))
+        s.put(os.path.join(dirpath, name), os.path.join(target, name))
+        s.chmod(os.path.join(target, name), st.st_mode & 0o7777)
+        s.utime(os.path.join(target, name), (st.st_atime, st.st_mtime))
+s.close()
+sys.stderr.write('%-20s %d files at %dms RTT in %.2fs\n' % ('put/chmod/utime', count, rtt * 1000, time.time() - start))
+
+remotedir = os.path.join(root, 'remote')
+for label in ('sync', 'sync (no changes)', 'sync (one change)'):
+    if label == 'sync (one change)':
+        with open(os.path.join(localdir, 'd1', 'e1', 'file1'), 'ab') as f:
+            f.write(b'more')
+    start = time.time()
+    counts, errors = sync_tree(t, localdir, remotedir)
+    assert not errors, errors
+    sys.stderr.write('%-20s %d files at %dms RTT in %.2fs: %r\n' % (
+        label, count, rtt * 1000, time.time() - start, dict([(k, v) for k, v in counts.items() if k != 'seconds'])))
+    compare(localdir, remotedir)
+    if label == 'sync (no changes)':
+        assert counts['sent'] == 0
+    if label == 'sync (one change)':
+        assert counts['sent'] == 1
+
+# Inventory taken (as Cluster.sync shares it between hosts) before a file is cut short
+shrinking = os.path.join(localdir, 'd2', 'shrinking')
+with open(shrinking, 'wb') as f:
+    f.write(os.urandom(100000))
+local = local_inventory(localdir)
+with open(shrinking, 'wb') as f:
+    f.write(b'0123456789')
+start = time.time()
+counts, errors = sync_tree(t, localdir, remotedir, local)
+assert not errors, errors
+assert counts['sent'] == 1 and counts['bytes'] == 10, counts
+with open(os.path.join(remotedir, 'd2', 'shrinking'), 'rb') as f:
+    assert f.read() == b'0123456789'
+sys.stderr.write('%-20s sent in %.2fs\n' % ('sync (shrunk file)', time.time() - start))
+t.close()
+shutil.rmtree(root)